@@ -0,0 +1,329 @@
+"""
+Benchmark of the environments' step and reset throughput, with fixed-seed random-policy rollouts on the shipped
+configurations.
+
+Examples
+--------
+>>> python -m nclustenv.bench --scenarios bic-binary-base tric-binary-base --output bench.json
+>>> python -m nclustenv.bench --env-kwargs '{"packed": true}'
+"""
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import nclustenv
+from nclustenv import configs
+from nclustenv.utils.datasets import SyntheticDataset
+
+# scenario name: (env id, config path in `nclustenv.configs`)
+SCENARIOS = {
+    'bic-binary-base': ('BiclusterEnv-v0', 'biclustering.binary.base'),
+    'bic-binary-basic_v1': ('BiclusterEnv-v0', 'biclustering.binary.basic_v1'),
+    'bic-binary-basic_v2': ('BiclusterEnv-v0', 'biclustering.binary.basic_v2'),
+    'bic-binary-basic_v3': ('BiclusterEnv-v0', 'biclustering.binary.basic_v3'),
+    'bic-binary-basic_v4': ('BiclusterEnv-v0', 'biclustering.binary.basic_v4'),
+    'bic-integer-basic': ('BiclusterEnv-v0', 'biclustering.integer.basic'),
+    'bic-real-base': ('BiclusterEnv-v0', 'biclustering.real.base'),
+    'tric-binary-base': ('TriclusterEnv-v0', 'triclustering.binary.base'),
+    'tric-real-base': ('TriclusterEnv-v0', 'triclustering.real.base'),
+    'offline-bic-binary-base': ('OfflineBiclusterEnv-v0', 'biclustering.binary.base'),
+    'offline-tric-binary-base': ('OfflineTriclusterEnv-v0', 'triclustering.binary.base'),
+    'vec-bic-binary-base': ('VecBiclusterEnv-v0', 'biclustering.binary.base'),
+    'vec-tric-binary-base': ('VecTriclusterEnv-v0', 'triclustering.binary.base'),
+}
+
+
+def load_config(path):
+
+    """Returns a copy of a configuration in `nclustenv.configs`, given its dotted path"""
+
+    module, name = path.rsplit('.', 1)
+
+    return dict(getattr(importlib.import_module('{}.{}'.format(configs.__name__, module)), name))
+
+
+def peak_rss():
+
+    """
+    Returns the peak resident set size of the process in MB, or None if it is not available. The peak only grows
+    during the lifetime of a process, so scenarios are measured in their own process (see `run`).
+    """
+
+    if resource is None:
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # kilobytes on linux, bytes on macOS
+    return rss / 2 ** 20 if sys.platform == 'darwin' else rss / 2 ** 10
+
+
+def _phases(before, after):
+
+    """Returns the time (ms) and number of calls of every phase recorded between two `timings` summaries"""
+
+    phases = {}
+
+    for phase, timing in after.items():
+        previous = before.get(phase, {'time': 0.0, 'calls': 0})
+        calls = timing['calls'] - previous['calls']
+
+        if calls:
+            phases[phase] = {'ms': (timing['time'] - previous['time']) * 1e3, 'calls': calls}
+
+    return phases
+
+
+def _latency(times):
+
+    times = np.array(times) * 1e3
+
+    if not len(times):
+        return {'p50': None, 'p99': None, 'mean': None}
+
+    return {
+        'p50': float(np.percentile(times, 50)),
+        'p99': float(np.percentile(times, 99)),
+        'mean': float(times.mean()),
+    }
+
+
+def make_env(scenario, seed=None, examples=20, num_envs=8, tmp_dir=None, **kwargs):
+
+    """
+    Builds the environment of a scenario.
+
+    Parameters
+    ----------
+
+    scenario: str
+        Name of a scenario in `SCENARIOS`.
+    seed: int, default None
+        Seed of the environment (and of its dataset, for offline environments).
+    examples: int, default 20
+        Number of examples of the dataset of offline environments.
+    num_envs: int, default 8
+        Number of episodes stepped in lockstep by vectorized environments.
+    tmp_dir: str, default None
+        Directory where the dataset of offline environments is saved.
+    **kwargs:
+        Extra environment parameters, overriding the configuration.
+
+    Returns
+    -------
+
+        gym environment
+            Environment.
+
+    """
+
+    env_id, path = SCENARIOS[scenario]
+    config = load_config(path)
+
+    if env_id.startswith('Offline'):
+        dataset = SyntheticDataset(
+            length=examples,
+            shape=config.pop('shape'),
+            clusters=config.pop('clusters'),
+            dataset_settings=config.pop('dataset_settings', None),
+            seed=seed,
+            generator='TriclusterGenerator' if env_id.startswith('OfflineTric') else 'BiclusterGenerator',
+            name=scenario,
+            save_dir=tmp_dir,
+        )
+        config['dataset'] = dataset
+
+    if env_id.startswith('Vec'):
+        config['num_envs'] = num_envs
+
+    else:
+        # phases are only timed on single environments, as vectorized environments step episodes in lockstep
+        config['timing'] = True
+
+    config.update(kwargs)
+
+    return nclustenv.make(env_id, seed=seed, **config)
+
+
+def run_scenario(scenario, episodes=5, max_steps=200, seed=0, **kwargs):
+
+    """
+    Runs random-policy rollouts on a scenario.
+
+    Parameters
+    ----------
+
+    scenario: str
+        Name of a scenario in `SCENARIOS`.
+    episodes: int, default 5
+        Number of episodes (resets).
+    max_steps: int, default 200
+        Maximum number of steps of every episode.
+    seed: int, default 0
+        Seed of the environment and policy.
+    **kwargs:
+        Parameters of `make_env`.
+
+    Returns
+    -------
+
+        dict
+            Step and reset latency (ms), throughput, peak RSS (MB) and the total time (ms) and number of calls of
+            every phase of steps and resets.
+
+    """
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        env = make_env(scenario, seed=seed, tmp_dir=tmp_dir, **kwargs)
+        env.action_space.seed(seed)
+
+        # only the rollouts are timed, not the reset of the constructor
+        before = getattr(env.unwrapped, 'timings', {})
+
+        resets, steps = [], []
+
+        for _ in range(episodes):
+
+            start = time.perf_counter()
+            env.reset()
+            resets.append(time.perf_counter() - start)
+
+            for _ in range(max_steps):
+
+                action = env.action_space.sample()
+
+                start = time.perf_counter()
+                _, _, done, _ = env.step(action)
+                steps.append(time.perf_counter() - start)
+
+                if np.all(done):
+                    break
+
+        phases = _phases(before, getattr(env.unwrapped, 'timings', {}))
+        env.close()
+
+    return {
+        'env': SCENARIOS[scenario][0],
+        'config': SCENARIOS[scenario][1],
+        'resets': len(resets),
+        'steps': len(steps),
+        'reset_ms': _latency(resets),
+        'step_ms': _latency(steps),
+        'resets_per_sec': len(resets) / sum(resets) if resets else None,
+        'steps_per_sec': len(steps) / sum(steps) if steps else None,
+        'peak_rss_mb': peak_rss(),
+        'phases': phases,
+    }
+
+
+def run(scenarios=None, episodes=5, max_steps=200, seed=0, isolate=True, **kwargs):
+
+    """
+    Runs the benchmark.
+
+    Parameters
+    ----------
+
+    scenarios: list[str], default None
+        Names of the scenarios to run, if None all of them are run.
+    episodes: int, default 5
+        Number of episodes of every scenario.
+    max_steps: int, default 200
+        Maximum number of steps of every episode.
+    seed: int, default 0
+        Seed of the environments and policy.
+    isolate: bool, default True
+        If True every scenario runs in its own (spawned) process, so that its peak RSS is its own. Otherwise it is
+        the peak of every scenario run so far.
+    **kwargs:
+        Parameters of `make_env`.
+
+    Returns
+    -------
+
+        dict
+            Benchmark settings and the results of every scenario, see `run_scenario`.
+
+    """
+
+    if scenarios is None:
+        scenarios = list(SCENARIOS)
+
+    results = {}
+
+    for scenario in scenarios:
+
+        if isolate:
+            # spawned, so that the process does not inherit a running JVM
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                results[scenario] = executor.submit(
+                    run_scenario, scenario, episodes=episodes, max_steps=max_steps, seed=seed, **kwargs
+                ).result()
+
+        else:
+            results[scenario] = run_scenario(scenario, episodes=episodes, max_steps=max_steps, seed=seed, **kwargs)
+
+    return {
+        'version': nclustenv.__version__,
+        'episodes': episodes,
+        'max_steps': max_steps,
+        'seed': seed,
+        'scenarios': results,
+    }
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Benchmarks the step and reset throughput of nclustenv environments.')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=None,
+                        help='scenarios to run (default: all)')
+    parser.add_argument('--episodes', type=int, default=5, help='episodes per scenario')
+    parser.add_argument('--max-steps', type=int, default=200, help='maximum steps per episode')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the environments and policy')
+    parser.add_argument('--examples', type=int, default=20, help='dataset length of offline environments')
+    parser.add_argument('--num-envs', type=int, default=8, help='episodes of vectorized environments')
+    parser.add_argument('--env-kwargs', type=json.loads, default={}, help='extra environment parameters, as JSON')
+    parser.add_argument('--no-isolate', dest='isolate', action='store_false',
+                        help='run every scenario in this process (peak RSS is then cumulative)')
+    parser.add_argument('--output', default=None, help='JSON file to write the results to (default: stdout)')
+
+    args = parser.parse_args(argv)
+
+    results = run(
+        args.scenarios,
+        episodes=args.episodes,
+        max_steps=args.max_steps,
+        seed=args.seed,
+        isolate=args.isolate,
+        examples=args.examples,
+        num_envs=args.num_envs,
+        **args.env_kwargs
+    )
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    return results
+
+
+if __name__ == '__main__':
+    main()
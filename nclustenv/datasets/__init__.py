@@ -2,4 +2,5 @@
 from pathlib import Path as _path
 SAVE_DIR = _path.joinpath(_path(__file__).parent.absolute(), 'bin')
 
+from .registry import register, load, names
 from . import biclustering, triclustering
@@ -1,8 +1,7 @@
 
-from nclustenv.utils.datasets import SyntheticDataset
 from nclustenv.utils.helper import inherit_config
 from nclustenv.configs.biclustering import binary
-from nclustenv.datasets import SAVE_DIR
+from nclustenv.datasets import SAVE_DIR, register, load
 
 
 _synthetic_base = {
@@ -13,4 +12,13 @@ _synthetic_base = {
             'generator': 'BiclusterGenerator'
         }
 
-base = SyntheticDataset(**inherit_config(binary.base, _synthetic_base, drop='max_steps'))
+register(**inherit_config(binary.base, _synthetic_base, drop='max_steps'))
+
+
+def __getattr__(name):
+
+    # datasets are only built (or loaded) on first access
+    if name == 'base':
+        return load('bic_binary_base')
+
+    raise AttributeError('module {} has no attribute {}'.format(__name__, name))
@@ -0,0 +1,32 @@
+_registry = {}
+_datasets = {}
+
+
+def register(name, **kwargs):
+
+    """Registers a dataset, to be built (or loaded from disk) on first access"""
+
+    _registry[name] = dict(kwargs, name=name)
+
+
+def load(name):
+
+    """Returns a registered dataset, building or loading it on first access"""
+
+    if name not in _datasets:
+
+        if name not in _registry:
+            raise KeyError('No registered dataset with name {}'.format(name))
+
+        from nclustenv.utils.datasets import SyntheticDataset
+
+        _datasets[name] = SyntheticDataset(**_registry[name])
+
+    return _datasets[name]
+
+
+def names():
+
+    """Returns the names of all registered datasets"""
+
+    return list(_registry.keys())
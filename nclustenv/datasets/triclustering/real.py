@@ -1,7 +1,6 @@
 
-from nclustenv.datasets import SAVE_DIR
+from nclustenv.datasets import SAVE_DIR, register, load
 from nclustenv.configs.triclustering import real
-from nclustenv.utils.datasets import SyntheticDataset
 from nclustenv.utils.helper import inherit_config
 
 _synthetic_base = {
@@ -12,4 +11,13 @@ _synthetic_base = {
             'generator': 'TriclusterGenerator'
         }
 
-base = SyntheticDataset(**inherit_config(real.base, _synthetic_base, drop='max_steps'))
\ No newline at end of file
+register(**inherit_config(real.base, _synthetic_base, drop='max_steps'))
+
+
+def __getattr__(name):
+
+    # datasets are only built (or loaded) on first access
+    if name == 'base':
+        return load('tric_real_base')
+
+    raise AttributeError('module {} has no attribute {}'.format(__name__, name))
@@ -1,5 +1,6 @@
 
-from .classic_lr import BiclusterEnv, OfflineBiclusterEnv, TriclusterEnv, OfflineTriclusterEnv
+from .classic_lr import BiclusterEnv, OfflineBiclusterEnv, TriclusterEnv, OfflineTriclusterEnv, VecBiclusterEnv, \
+    VecTriclusterEnv
 
 from gym.envs import register
 
@@ -20,3 +21,12 @@ register(id='OfflineBiclusterEnv-v0',
 register(id='OfflineTriclusterEnv-v0',
          entry_point='nclustenv.environments.classic_lr.triclusterenv:OfflineTriclusterEnv'
          )
+
+# Vectorized Environments
+register(id='VecBiclusterEnv-v0',
+         entry_point='nclustenv.environments.classic_lr.biclusterenv:VecBiclusterEnv'
+         )
+
+register(id='VecTriclusterEnv-v0',
+         entry_point='nclustenv.environments.classic_lr.triclusterenv:VecTriclusterEnv'
+         )
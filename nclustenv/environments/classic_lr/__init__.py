@@ -1,3 +1,3 @@
 
-from .biclusterenv import BiclusterEnv, OfflineBiclusterEnv
-from .triclusterenv import TriclusterEnv, OfflineTriclusterEnv
\ No newline at end of file
+from .biclusterenv import BiclusterEnv, OfflineBiclusterEnv, VecBiclusterEnv
+from .triclusterenv import TriclusterEnv, OfflineTriclusterEnv, VecTriclusterEnv
\ No newline at end of file
@@ -1,4 +1,5 @@
 import abc
+import copy
 import termios
 from abc import ABC
 from statistics import mean
@@ -12,7 +13,9 @@ from nclustenv.utils.spaces import DGLHeteroGraphSpace
 from scipy.optimize import linear_sum_assignment
 
 from nclustenv.utils import actions, metrics
+from nclustenv.utils.generation import EpisodePool
 from nclustenv.utils.helper import loader, parse_ds_settings, parse_bool_input
+from nclustenv.utils.timing import PhaseTimer, NULL_TIMER
 
 
 class BaseEnv(gym.Env, ABC):
@@ -38,6 +41,15 @@ class BaseEnv(gym.Env, ABC):
             error_margin=0.05,
             penalty=0.001,
             reward_shaping=1.0,
+            prefetch=0,
+            workers=None,
+            packed=False,
+            observation='graph',
+            max_clusters=None,
+            timing=False,
+            construction='nclustgen',
+            sparsify=None,
+            device=None,
             *args, **kwargs
     ):
 
@@ -86,6 +98,8 @@ class BaseEnv(gym.Env, ABC):
 
         action: str or class, default 'Action'.
             The name of a action class implemented in `utils.actions`, or a pointer for a personalised action class.
+            Action classes may set a `nparams` attribute with the number of parameters of every action (default 3),
+            e.g. 'RangeAction', which adds or removes ranges of nodes.
         max_steps: int, default 200
             Maximum number of actions an agent can perform in a given environment.
         error_margin: float, default 0.05
@@ -94,6 +108,38 @@ class BaseEnv(gym.Env, ABC):
             Penalty on reward per timestep (discount factor).
         reward_shaping: float, default 1.0
             Percentage of shaping used in reward.
+        prefetch: int, default 0
+            Number of episodes generated ahead of time by background processes, so that `reset` does not wait on the
+            generator. If 0 episodes are generated on `reset`. Episodes are built with `construction`, on the cpu,
+            and moved to `device` once ready. Offline environments load examples ahead of time instead.
+        workers: int, default None
+            Number of background processes generating (or loading) episodes, if None it defaults to `prefetch`.
+        packed: bool, default False
+            If True the state keeps the clusters as packed bits, and only writes them to the graph when an observation
+            is emitted.
+        observation: {'graph', 'view', 'dense'}, default 'graph'
+            Observation type. 'graph' observes the state's graph, which keeps changing during the episode, 'view'
+            observes a `GraphView` snapshot that shares the episode's structure and edge weights, and only builds the
+            graph when requested, and 'dense' observes the values and cluster membership as arrays preallocated to the
+            maximum shape and updated in place (see `utils.observations.DenseObservation`).
+        max_clusters: int, default None
+            Maximum number of found clusters per episode, only used if `n` is None (splitting is masked once reached).
+            With dense observations it defaults to twice the maximum number of hidden clusters, otherwise None sets
+            no limit.
+        timing: bool, default False
+            If True the wall time and number of calls of the phases of `step` and `reset` (action, metric,
+            assignment, observation, generation, to_graph, sparsify and, offline, loading) are recorded, see
+            `timings`. They are also returned in the step info, under `timings`.
+        construction: {'nclustgen', 'dense'}, default 'nclustgen'
+            How online episodes build their graph, 'dense' builds it from the generated array with vectorized index
+            generation, for large shapes (see `State`).
+        sparsify: callable, default None
+            Policy selecting the edges kept in the observed graphs, applied once per episode to cut their memory and
+            message passing cost (e.g. `utils.sparsify.TopK(16)`). The reward is still computed on the hidden
+            clusters of the full data. If None the graphs are not sparsified.
+        device: str or torch device, default None
+            Device of the graphs, cluster tensors and metric computation, e.g. 'cpu' for cpu-only rollouts, which then
+            neither probe for a gpu nor transfer data (see `State`). If None graphs are built on the gpu if available.
 
         Attributes
         ----------
@@ -132,6 +178,8 @@ class BaseEnv(gym.Env, ABC):
 
         # metric pointer
         self._metric = loader(metric, metrics)
+        self._batched_metric = getattr(self._metric, 'batched', None)
+        self._incremental_metric = getattr(self._metric, 'incremental', None)
 
         # action pointer
         self._action = loader(action, actions)
@@ -143,9 +191,29 @@ class BaseEnv(gym.Env, ABC):
         self.target = error_margin
         self.penalty = penalty
 
+        self._prefetch = int(prefetch)
+        self._workers = workers
+        self._pool = None
+        self._packed = packed
+        self._observation = observation
+        self._timer = PhaseTimer() if timing else NULL_TIMER
+        self._construction = construction
+        self._sparsify = sparsify
+        self._device = device
+        self._max_shape = list(shape[1])
+
+        if n is not None:
+            self._max_clusters = int(n)
+        elif max_clusters is None and observation == 'dense':
+            self._max_clusters = 2 * int(clusters[1])
+        else:
+            self._max_clusters = max_clusters
+
         # Init
 
         self._last_distances = None
+        self._tracker = None
+        self._assignment = None
         self._current_step = None
         self._steps_beyond_done = None
         self._done = None
@@ -157,25 +225,42 @@ class BaseEnv(gym.Env, ABC):
 
         # spaces
         _actions = 4
+        _params = getattr(self._action, 'nparams', 3)
 
         self.action_space = spaces.Tuple((spaces.Discrete(_actions),
                                           spaces.Tuple(
-                                              [spaces.Box(low=0.0, high=1.0, shape=(3,), dtype=np.float32)
+                                              [spaces.Box(low=0.0, high=1.0, shape=(_params,), dtype=np.float32)
                                                for _ in range(_actions)]
                                           )))
 
+        # episodes are sampled from the graph space, whatever the observation type
+        self._space = DGLHeteroGraphSpace(
+            shape=shape,
+            n=n,
+            clusters=clusters,
+            settings=self.dataset_settings,
+            np_random=self.np_random,
+            dtype=np.int32,
+            **kwargs
+        )
+
+        if observation == 'dense':
+            state_space = spaces.Dict({
+                "values": spaces.Box(-np.inf, np.inf, shape=tuple(self._max_shape), dtype=np.float32),
+                "shape": spaces.Box(low=np.array(shape[0]), high=np.array(shape[1]), dtype=np.int32),
+                "clusters": spaces.Tuple(
+                    [spaces.MultiBinary([self._max_clusters, size]) for size in self._max_shape]
+                ),
+                "nclusters": spaces.Discrete(self._max_clusters + 1)
+            })
+
+        else:
+            state_space = self._space
+
         self.observation_space = spaces.Dict({
             "action_mask": spaces.Box(0, 1, shape=(4,), dtype=np.float32),
             "avail_actions": spaces.Box(0, 1, shape=(4,), dtype=np.float32),
-            "state": DGLHeteroGraphSpace(
-                shape=shape,
-                n=n,
-                clusters=clusters,
-                settings=self.dataset_settings,
-                np_random=self.np_random,
-                dtype=np.int32,
-                **kwargs
-            )
+            "state": state_space
         })
 
     def seed(self, seed=None):
@@ -230,30 +315,61 @@ class BaseEnv(gym.Env, ABC):
 
         """
 
+        return self.step_many([action])
+
+    def step_many(self, actions):
+
+        """
+        Runs several actions as a single timestep, e.g. the node edits of a macro action. The actions are applied in
+        order, and the volume match, reward and observation are only computed once, after the last one. Every action
+        counts towards `max_steps` and is penalized.
+
+        Parameters
+        ----------
+
+        actions: list
+            Actions provided by the agent.
+
+        Returns
+        -------
+
+            object
+                Agent's observation of the current environment.
+            float
+                Amount of reward returned after the actions.
+            bool
+                Whether the episode has ended, in which case further step() calls will return undefined results.
+            dict
+                Contains auxiliary diagnostic information (helpful for debugging, and sometimes learning).
+
+        """
+
         if not self._done:
-            self._current_step += 1
-            action_ = self._action(*action)
+            self._current_step += len(actions)
 
-            # Take action
-            getattr(self.state, action_.action)(action_.parameters)
+            # Take actions
+            with self._timer.phase('action'):
+                for action in actions:
+                    action_ = self._action(*action)
+                    getattr(self.state, action_.action)(action_.parameters)
 
-            # calculate volume match
+            # calculate volume match, edits are applied to the metric at once
             self._last_distances.pop(0)
-            self._last_distances.append(self.volume_match)
+            self._last_distances.append(self._update_volume_match())
 
             # check state
 
             if self._last_distances[-1] == 0.0:
-                reward = self.get_reward(self._last_distances, True)
+                reward = self.get_reward(self._last_distances, True, steps=len(actions))
                 self._done = True
             elif mean(self._last_distances) <= self.target:
-                reward = self.get_reward(self._last_distances, True, True)
+                reward = self.get_reward(self._last_distances, True, True, steps=len(actions))
                 self._done = True
             elif self._current_step > self.max_steps:
                 reward = -1.0 * self._reward_shaping
                 self._done = True
             else:
-                reward = self.get_reward(self._last_distances)
+                reward = self.get_reward(self._last_distances, steps=len(actions))
 
         else:
             if self._steps_beyond_done == 0:
@@ -267,12 +383,119 @@ class BaseEnv(gym.Env, ABC):
             self._steps_beyond_done += 1
             reward = 0.0
 
-        return self.state.state, reward, self._done, {}
+        obs = self.state.state
+        info = {'timings': self._timer.summary()} if self._timer.enabled else {}
+
+        return obs, reward, self._done, info
+
+    def snapshot(self):
+
+        """
+        Returns the mutable part of the environment, so that it can be restored later in the same episode (e.g. to
+        branch a tree search). The episode data is shared, not copied.
+
+        Returns
+        -------
+
+            dict
+                Snapshot token, to be passed to `restore`.
+
+        """
+
+        copy_tracker = getattr(self._tracker, 'copy', None)
+
+        return {
+            'state': self.state.snapshot(),
+            'current_step': self._current_step,
+            'steps_beyond_done': self._steps_beyond_done,
+            'last_distances': list(self._last_distances),
+            'done': self._done,
+            'tracker': None if copy_tracker is None else copy_tracker(),
+            'assignment': self._assignment,
+            'random': self.np_random.get_state(),
+        }
 
-    def get_reward(self, last_distances, goal=False, error=False):
+    def clone(self):
 
         """
-        Returns the reward for the current state.
+        Returns an environment in the current episode that steps independently (e.g. to explore branches of a search
+        in parallel). The clone shares the episode's graph structure, edge weights and hidden clusters, which are
+        moved to shared memory, and only owns its cluster membership and loggers. Its random object starts as a copy
+        of this environment's, it records its own timings, and it generates episodes on `reset` without prefetching.
+
+        Returns
+        -------
+
+            BaseEnv
+                Cloned environment.
+
+        """
+
+        env = copy.copy(self)
+
+        env.np_random = np.random.RandomState()
+        env.np_random.set_state(self.np_random.get_state())
+
+        env._timer = PhaseTimer() if self._timer.enabled else NULL_TIMER
+        env.state = self.state.clone(np_random=env.np_random, timer=env._timer)
+
+        # episodes are sampled with the clone's random object
+        env._space = copy.copy(self._space)
+        env._space._np_random = env.np_random
+
+        state_space = self.observation_space['state']
+        env.observation_space = spaces.Dict({
+            **self.observation_space.spaces, 'state': env._space if state_space is self._space else state_space
+        })
+
+        env._prefetch = 0
+        env._pool = None
+
+        copy_tracker = getattr(self._tracker, 'copy', None)
+
+        env._last_distances = list(self._last_distances)
+        env._tracker = None if copy_tracker is None else copy_tracker()
+
+        return env
+
+    def restore(self, token):
+
+        """
+        Restores a snapshot taken in the current episode, the same snapshot can be restored any number of times.
+
+        Parameters
+        ----------
+
+        token: dict
+            Snapshot token, as returned by `snapshot`.
+
+        Returns
+        -------
+
+            object
+                Agent's observation of the restored environment.
+
+        """
+
+        self.state.restore(token['state'])
+
+        self._current_step = token['current_step']
+        self._steps_beyond_done = token['steps_beyond_done']
+        self._last_distances = list(token['last_distances'])
+        self._done = token['done']
+
+        # the incremental metric is rebuilt on the next step if it can not be copied
+        self._tracker = None if token['tracker'] is None else token['tracker'].copy()
+        self._assignment = token['assignment']
+
+        self.np_random.set_state(token['random'])
+
+        return self.state.state
+
+    def get_reward(self, last_distances, goal=False, error=False, steps=1):
+
+        """
+        Returns the reward for the current state, penalizing every step taken to reach it.
 
         Returns
         -------
@@ -284,10 +507,29 @@ class BaseEnv(gym.Env, ABC):
 
         return float(
             ((last_distances[-2] - last_distances[-1])
-             - self.penalty)
+             - self.penalty * steps)
             + (((2 * self._reward_shaping) if goal else 0) - ((1 * self._reward_shaping) if error else 0))
         )
 
+    @property
+    def cost_matrix(self):
+
+        """
+        Returns the distance between every found and hidden cluster for the current state.
+
+        Returns
+        -------
+
+            numpy array
+                Cost matrix, **Shape**: (nclusters, nhclusters).
+
+        """
+
+        if self._batched_metric is not None:
+            return self._batched_metric(self.state.membership, self.state.hmembership)
+
+        return self._metric(self.state.clusters, self.state.hclusters)
+
     @property
     def volume_match(self):
 
@@ -302,11 +544,93 @@ class BaseEnv(gym.Env, ABC):
 
         """
 
-        cost_matrix = self._metric(self.state.clusters, self.state.hclusters)
-        row_ind, col_ind = linear_sum_assignment(cost_matrix)
+        with self._timer.phase('metric'):
+            cost_matrix = self.cost_matrix
+
+        with self._timer.phase('assignment'):
+            row_ind, col_ind = linear_sum_assignment(cost_matrix)
 
         return (cost_matrix[row_ind, col_ind] * self.state.cluster_coverage[col_ind]).sum()
 
+    def _update_volume_match(self):
+
+        """
+        Returns the volume match for the current state. If the metric has an incremental implementation, it is updated
+        with the state's edits since the last call, and the assignment is only solved again if those edits might
+        change it.
+
+        Returns
+        -------
+
+            float
+                Current volume match.
+
+        """
+
+        edits = self.state.pop_edits()
+
+        if self._incremental_metric is None:
+            return self.volume_match
+
+        with self._timer.phase('metric'):
+
+            if edits is None or self._tracker is None or self._tracker.hmembership is not self.state.hmembership:
+                self._tracker = self._incremental_metric(self.state.membership, self.state.hmembership)
+                solve = True
+
+            else:
+                previous = self._tracker.update(edits)
+                solve = len(previous) > 1 or (previous and not self._assignment_holds(*previous.popitem()))
+
+        if solve:
+            with self._timer.phase('assignment'):
+                self._assignment = linear_sum_assignment(self._tracker.cost_matrix)
+
+        row_ind, col_ind = self._assignment
+
+        return (self._tracker.cost_matrix[row_ind, col_ind] * self.state.cluster_coverage[col_ind]).sum()
+
+    def _assignment_holds(self, row, previous):
+
+        """
+        Returns if the current assignment is still optimal after a single row of the cost matrix changed.
+
+        Parameters
+        ----------
+
+        row: int
+            Index of the changed row.
+        previous: numpy array
+            Previous values of the changed row.
+
+        Returns
+        -------
+
+            bool
+                If the assignment does not need to be solved again.
+
+        """
+
+        cost_matrix = self._tracker.cost_matrix
+        row_ind, col_ind = self._assignment
+
+        delta = cost_matrix[row] - previous
+
+        if not delta.any():
+            return True
+
+        # Any other assignment changes its cost by the delta of the column it gives to `row`, or by nothing if `row`
+        # is left out (only possible when there are more found than hidden clusters)
+        unassigned = len(row_ind) < cost_matrix.shape[0]
+        assigned = np.flatnonzero(row_ind == row)
+
+        if not len(assigned):
+            return bool((delta > 0).all())
+
+        col = col_ind[assigned[0]]
+
+        return bool((delta[col] < np.delete(delta, col)).all() and (not unassigned or delta[col] < 0))
+
     @property
     def best_match(self):
 
@@ -321,7 +645,7 @@ class BaseEnv(gym.Env, ABC):
 
         """
 
-        return linear_sum_assignment(self._metric(self.state.clusters, self.state.hclusters))
+        return linear_sum_assignment(self.cost_matrix)
 
     def reset(self):
 
@@ -345,7 +669,46 @@ class BaseEnv(gym.Env, ABC):
         self._last_distances = [1.0, 1.0, 1.0]
         self._done = False
 
-        return self.state.reset(*self.observation_space['state'].sample())
+        if self._prefetch:
+
+            if self._pool is None:
+                self._pool = EpisodePool(
+                    self.state._cls, self._space.sample, size=self._prefetch, workers=self._workers,
+                    construction=self._construction, device=self._device
+                )
+
+            with self._timer.phase('generation'):
+                episode = self._pool.pop()
+
+            return self.state.reset_from(episode, clust_init=self._space.clust_init)
+
+        return self.state.reset(*self._space.sample())
+
+    @property
+    def timings(self):
+
+        """
+        Returns the phases recorded since the environment was created, if `timing` is enabled.
+
+        Returns
+        -------
+
+            dict
+                Cumulative wall time (`time`, in seconds) and number of calls (`calls`) of every phase.
+
+        """
+
+        return self._timer.summary()
+
+    def close(self):
+
+        """
+        Stops the background processes generating episodes, if any.
+        """
+
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
 
     @abc.abstractmethod
     def _render(self, index):
@@ -1,5 +1,6 @@
 
 from .base import BaseEnv
+from .vecbase import VecBaseEnv
 from nclustenv.utils.states import State, OfflineState
 from nclustenv.utils.helper import matrix_to_string, index_to_matrix
 
@@ -49,7 +50,11 @@ class BiclusterEnv(BaseEnv):
         )
 
         if init_state:
-            self.state = State(generator='BiclusterGenerator', n=n, np_random=self.np_random)
+            self.state = State(
+                generator='BiclusterGenerator', n=n, np_random=self.np_random, packed=self._packed,
+                observation=self._observation, max_shape=self._max_shape, max_clusters=self._max_clusters,
+                timer=self._timer, construction=self._construction, sparsify=self._sparsify, device=self._device
+            )
             self.reset()
 
     def _render(self, index):
@@ -78,8 +83,8 @@ class OfflineBiclusterEnv(BiclusterEnv):
         Parameters
         ----------
 
-        dataset: SyntheticDataset
-            DGLdataset to train on.
+        dataset: SyntheticDataset or StreamingDataset
+            DGLdataset to train on, or stream of saved datasets (shards) for corpora that do not fit in memory.
         n: int, default None
             Number of clusters to find, use None to train the undefined clusters tasks.
         seed: int, default None
@@ -141,7 +146,21 @@ class OfflineBiclusterEnv(BiclusterEnv):
             *args, **kwargs
         )
 
-        self.state = OfflineState(dataset=dataset, train_test_split=train_test_split, n=n, np_random=self.np_random)
+        self.state = OfflineState(
+            dataset=dataset,
+            train_test_split=train_test_split,
+            n=n,
+            np_random=self.np_random,
+            prefetch=self._prefetch,
+            workers=self._workers,
+            packed=self._packed,
+            observation=self._observation,
+            max_shape=self._max_shape,
+            max_clusters=self._max_clusters,
+            timer=self._timer,
+            sparsify=self._sparsify,
+            device=self._device
+        )
         self.reset()
 
     def reset(self, train=True):
@@ -166,3 +185,48 @@ class OfflineBiclusterEnv(BiclusterEnv):
         self._done = False
 
         return self.state.reset(train=train)
+
+
+class VecBiclusterEnv(VecBaseEnv):
+
+    """
+    This class provides an implementation of a vectorized two-dimensional gym environment with hidden biclusters, that
+    steps `num_envs` episodes in lockstep.
+    """
+
+    _generator = 'BiclusterGenerator'
+
+    def __init__(
+            self,
+            num_envs=8,
+            shape=None,
+            n=None,
+            clusters=None,
+            dataset_settings=None,
+            seed=None,
+            max_steps=200,
+            error_margin=0.05,
+            penalty=0.001,
+            *args, **kwargs
+    ):
+
+        if shape is None:
+            shape = [[100, 100], [200, 200]]
+
+        if len(shape[0]) != 2:
+            raise AttributeError('Shape does not produce a bidimensional dataset')
+
+        super(VecBiclusterEnv, self).__init__(
+            num_envs=num_envs,
+            shape=shape,
+            n=n,
+            clusters=clusters,
+            dataset_settings=dataset_settings,
+            seed=seed,
+            max_steps=max_steps,
+            error_margin=error_margin,
+            penalty=penalty,
+            *args, **kwargs
+        )
+
+        self.reset()
@@ -1,5 +1,6 @@
 
 from .base import BaseEnv
+from .vecbase import VecBaseEnv
 from nclustenv.utils.states import State, OfflineState
 from nclustenv.utils.helper import tensor_to_string, index_to_tensor
 
@@ -55,7 +56,11 @@ class TriclusterEnv(BaseEnv):
         )
 
         if init_state:
-            self.state = State(generator='TriclusterGenerator', n=n, np_random=self.np_random)
+            self.state = State(
+                generator='TriclusterGenerator', n=n, np_random=self.np_random, packed=self._packed,
+                observation=self._observation, max_shape=self._max_shape, max_clusters=self._max_clusters,
+                timer=self._timer, construction=self._construction, sparsify=self._sparsify, device=self._device
+            )
             self.reset()
 
     def _render(self, index):
@@ -84,8 +89,8 @@ class OfflineTriclusterEnv(TriclusterEnv):
         Parameters
         ----------
 
-        dataset: SyntheticDataset
-            DGLdataset to train on.
+        dataset: SyntheticDataset or StreamingDataset
+            DGLdataset to train on, or stream of saved datasets (shards) for corpora that do not fit in memory.
         n: int, default None
             Number of clusters to find, use None to train the undefined clusters tasks.
         seed: int, default None
@@ -147,7 +152,21 @@ class OfflineTriclusterEnv(TriclusterEnv):
             *args, **kwargs
         )
 
-        self.state = OfflineState(dataset=dataset, train_test_split=train_test_split, n=n, np_random=self.np_random)
+        self.state = OfflineState(
+            dataset=dataset,
+            train_test_split=train_test_split,
+            n=n,
+            np_random=self.np_random,
+            prefetch=self._prefetch,
+            workers=self._workers,
+            packed=self._packed,
+            observation=self._observation,
+            max_shape=self._max_shape,
+            max_clusters=self._max_clusters,
+            timer=self._timer,
+            sparsify=self._sparsify,
+            device=self._device
+        )
         self.reset()
 
     def reset(self, train=True):
@@ -172,3 +191,56 @@ class OfflineTriclusterEnv(TriclusterEnv):
         self._done = False
 
         return self.state.reset(train=train)
+
+
+class VecTriclusterEnv(VecBaseEnv):
+
+    """
+    This class provides an implementation of a vectorized three-dimensional gym environment with hidden triclusters,
+    that steps `num_envs` episodes in lockstep.
+    """
+
+    _generator = 'TriclusterGenerator'
+
+    def __init__(
+            self,
+            num_envs=8,
+            shape=None,
+            n=None,
+            clusters=None,
+            dataset_settings=None,
+            seed=None,
+            max_steps=200,
+            error_margin=0.05,
+            penalty=0.001,
+            *args, **kwargs
+    ):
+
+        if shape is None:
+            shape = [[100, 100, 2], [200, 200, 5]]
+
+        # Enforce shape size
+
+        if len(shape[0]) != 3:
+            raise AttributeError('Shape does not produce a tridimensional dataset')
+
+        # Enforce ctx > 1
+        if shape[0][-1] < 2:
+            shape[0][-1] = 2
+        elif shape[1][-1] < 2:
+            shape[1][-1] = 2
+
+        super(VecTriclusterEnv, self).__init__(
+            num_envs=num_envs,
+            shape=shape,
+            n=n,
+            clusters=clusters,
+            dataset_settings=dataset_settings,
+            seed=seed,
+            max_steps=max_steps,
+            error_margin=error_margin,
+            penalty=penalty,
+            *args, **kwargs
+        )
+
+        self.reset()
@@ -0,0 +1,560 @@
+from abc import ABC
+
+import dgl
+import gym
+import numpy as np
+import torch as th
+from gym import spaces
+from gym.utils import seeding
+from scipy.optimize import linear_sum_assignment
+
+from nclustenv.utils.spaces import DGLHeteroGraphSpace
+from nclustenv.utils.states import State
+from nclustenv.utils.helper import parse_ds_settings
+
+
+class VecBaseEnv(gym.Env, ABC):
+
+    """
+    Abstract class from where dimensional specific vectorized environments should inherit. Should not be called
+    directly.
+    This class steps `num_envs` episodes in lockstep, keeping the cluster membership of every episode in batched tensors
+    and the observations in a single batched graph. Episodes that end are automatically reset.
+    """
+
+    metadata = {'render.modes': []}
+
+    _generator = None
+
+    def __init__(
+            self,
+            num_envs,
+            shape,
+            n=None,
+            clusters=None,
+            dataset_settings=None,
+            seed=None,
+            max_steps=200,
+            error_margin=0.05,
+            penalty=0.001,
+            reward_shaping=1.0,
+            max_clusters=None,
+            *args, **kwargs
+    ):
+
+        """
+        Parameters
+        ----------
+
+        num_envs: int
+            Number of episodes stepped in lockstep.
+        shape: list, default [[100, 100, 2], [200, 200, 5]]
+            List of length 2 where the first element is the minimum shape the observation space and the second is the
+            maximum.
+        n: int, default None
+            Number of clusters to find, use None to train the undefined clusters tasks.
+        clusters: [int], default [1, 1]
+            List of length 2 where the first element is the minimum number of cluster to be hidden in the environment
+            and the second is the maximum.
+        dataset_settings: dict, default {}
+            Dataset settings to be passed to generator, see `BaseEnv`.
+        seed: int, default None
+            Seed to initialize random object.
+        max_steps: int, default 200
+            Maximum number of actions an agent can perform in a given environment.
+        error_margin: float, default 0.05
+            Margin of error for agent.
+        penalty: float, default 0.001
+            Penalty on reward per timestep (discount factor).
+        reward_shaping: float, default 1.0
+            Percentage of shaping used in reward.
+        max_clusters: int, default None
+            Maximum number of found clusters per episode, only used if `n` is None (splitting is masked once reached).
+            If None, it defaults to twice the maximum number of hidden clusters.
+
+        Note
+        ----
+            The reward is computed with the `match_score` metric, and actions are parsed as by the `Action` class.
+
+        Attributes
+        ----------
+
+        num_envs: int
+            Number of episodes stepped in lockstep.
+        single_action_space: gym space
+            Action space of a single episode.
+        action_space: gym space
+            Space from where the agent samples batched actions, (actions indexes, actions parameters).
+        single_observation_space: gym space
+            Observation space of a single episode.
+        np_random: numpy random object
+            Random object.
+        states: list[State]
+            State objects used to generate each episode.
+
+        """
+
+        super(VecBaseEnv, self).__init__()
+
+        if clusters is None:
+            clusters = [1, 1]
+
+        if dataset_settings is None:
+            dataset_settings = {}
+
+        self.num_envs = int(num_envs)
+        self.n = n
+        self.defined = n is not None
+        self.dataset_settings = parse_ds_settings(dataset_settings)
+
+        self._clusters = clusters
+        self._max_hclusters = int(clusters[1])
+
+        if self.defined:
+            self._capacity = int(n)
+        elif max_clusters is None:
+            self._capacity = 2 * self._max_hclusters
+        else:
+            self._capacity = int(max_clusters)
+
+        self._reward_shaping = float(max(reward_shaping, 0.0))
+
+        self.max_steps = max_steps
+        self.target = error_margin
+        self.penalty = penalty
+
+        self.np_random = None
+        self.seed(seed)
+
+        # spaces
+        _actions = 4
+
+        self.single_action_space = spaces.Tuple((spaces.Discrete(_actions),
+                                                 spaces.Tuple(
+                                                     [spaces.Box(low=0.0, high=1.0, shape=(3,), dtype=np.float32)
+                                                      for _ in range(_actions)]
+                                                 )))
+
+        self.action_space = spaces.Tuple((
+            spaces.MultiDiscrete([_actions for _ in range(self.num_envs)]),
+            spaces.Box(low=0.0, high=1.0, shape=(self.num_envs, _actions, 3), dtype=np.float32)
+        ))
+
+        self.single_observation_space = spaces.Dict({
+            "action_mask": spaces.Box(0, 1, shape=(4,), dtype=np.float32),
+            "avail_actions": spaces.Box(0, 1, shape=(4,), dtype=np.float32),
+            "state": DGLHeteroGraphSpace(
+                shape=shape,
+                n=n,
+                clusters=clusters,
+                settings=self.dataset_settings,
+                np_random=self.np_random,
+                dtype=np.int32,
+                **kwargs
+            )
+        })
+
+        self.observation_space = spaces.Dict({
+            "action_mask": spaces.Box(0, 1, shape=(self.num_envs, 4), dtype=np.float32),
+            "avail_actions": spaces.Box(0, 1, shape=(self.num_envs, 4), dtype=np.float32),
+            "state": self.single_observation_space['state']
+        })
+
+        # episodes are batched on the cpu, so they are built there, without probing for a gpu
+        self.states = [
+            State(generator=self._generator, np_random=self.np_random, device='cpu') for _ in range(self.num_envs)
+        ]
+
+        # Batched episode data
+        self._graph = None
+        self._ntypes = None
+        self._membership = None
+        self._hmembership = None
+        self._hnodes = None
+        self._node_env = None
+        self._offsets = None
+        self._nnodes = None
+
+        # Batched episode loggers
+        self._nclusters = np.full(self.num_envs, 1 if not self.defined else self._capacity, dtype=np.int64)
+        self._nhclusters = np.zeros(self.num_envs, dtype=np.int64)
+        self._coverage = np.zeros((self.num_envs, self._max_hclusters))
+        self._hsize = None
+        self._current_step = np.zeros(self.num_envs, dtype=np.int64)
+        self._last_distances = np.ones((self.num_envs, 3))
+
+    def seed(self, seed=None):
+
+        """
+        Sets the seed for this env's random number generator(s).
+
+        Returns
+        -------
+
+            [int]
+                Returns the list of seeds used in this env's random number generators.
+        """
+
+        self.np_random, seed = seeding.np_random(seed)
+        return [seed]
+
+    @property
+    def membership(self):
+
+        """
+        Returns the found clusters of every episode as bool tensors, one per ntype.
+
+        Returns
+        -------
+
+            list[tensor]
+                Cluster membership, **Shape**: (max_clusters, nnodes in batch) per ntype.
+
+        """
+
+        return self._membership
+
+    def _reset_envs(self, envs):
+
+        """
+        Generates new episodes for the given environments, and rebuilds the batched graph.
+
+        Parameters
+        ----------
+
+        envs: numpy array
+            Indexes of the environments to reset.
+
+        """
+
+        space = self.single_observation_space['state']
+
+        for i in envs:
+            self.states[i].reset(*space.sample(), not_init=True)
+
+            self._nclusters[i] = self._capacity if self.defined else 1
+            self._nhclusters[i] = len(self.states[i].hclusters)
+            self._coverage[i] = 0.0
+            self._coverage[i, :self._nhclusters[i]] = self.states[i].cluster_coverage
+            self._current_step[i] = 0
+            self._last_distances[i] = 1.0
+
+        reset = np.zeros(self.num_envs, dtype=bool)
+        reset[envs] = True
+
+        graph = dgl.batch([state.current for state in self.states])
+
+        if self._ntypes is None:
+            self._ntypes = self.states[0]._ntypes
+            self._membership = [None for _ in self._ntypes]
+            self._hmembership = [None for _ in self._ntypes]
+            self._node_env = [None for _ in self._ntypes]
+            self._offsets = [None for _ in self._ntypes]
+            self._nnodes = [None for _ in self._ntypes]
+
+        for a, ntype in enumerate(self._ntypes):
+
+            nnodes = graph.batch_num_nodes(ntype).cpu()
+            node_env = th.repeat_interleave(th.arange(self.num_envs), nnodes)
+
+            membership = th.zeros((self._capacity, int(nnodes.sum())), dtype=th.bool)
+
+            # carry over the clusters of the episodes that were not reset
+            if self._membership[a] is not None:
+                keep = th.from_numpy(~reset)
+                membership[:, keep[node_env]] = self._membership[a][:, keep[self._node_env[a]]]
+
+            hmembership = [
+                th.cat([
+                    state.hmembership[a].cpu(),
+                    th.zeros((self._max_hclusters - len(state.hclusters), state.current.num_nodes(ntype)),
+                             dtype=th.bool)
+                ])
+                for state in self.states
+            ]
+
+            self._membership[a] = membership
+            self._hmembership[a] = th.cat(hmembership, 1)
+            self._node_env[a] = node_env
+            self._offsets[a] = np.concatenate(([0], np.cumsum(nnodes.numpy())))
+            self._nnodes[a] = nnodes.numpy()
+
+            for k in range(self._capacity):
+                graph.nodes[ntype].data[k] = membership[k]
+
+        self._hsize = self._segment_sum(self._hmembership)
+
+        # members of every hidden cluster, and their episode, as hidden clusters are fixed for the episodes
+        self._hnodes = [
+            [(nodes, self._node_env[a][nodes]) for nodes in (th.nonzero(mask).flatten() for mask in h)]
+            for a, h in enumerate(self._hmembership)
+        ]
+        self._graph = graph
+
+    def _segment_sum(self, membership):
+
+        """Returns the size of every cluster of every episode, shape (num_envs, nclusters)"""
+
+        size = 0
+
+        for a, mask in enumerate(membership):
+            size = size + th.zeros((self.num_envs, mask.shape[0])).index_add_(0, self._node_env[a], mask.T.float())
+
+        return size
+
+    def _set_nodes(self, index, params):
+
+        """
+        Applies the add and remove actions of every episode.
+
+        Parameters
+        ----------
+
+        index: numpy array
+            Action index of each episode.
+        params: numpy array
+            Action parameters of each episode, [ntype, node, cluster], range: [0, 1]
+
+        """
+
+        axis = np.rint(params[:, 0] * (len(self._ntypes) - 1)).astype(np.int64)
+
+        for a in range(len(self._ntypes)):
+
+            envs = np.flatnonzero((index < 2) & (axis == a))
+
+            if len(envs):
+                node = np.rint(params[envs, 1] * (self._nnodes[a][envs] - 1)).astype(np.int64)
+                cluster = np.rint(params[envs, 2] * (self._nclusters[envs] - 1)).astype(np.int64)
+
+                self._membership[a][th.from_numpy(cluster), th.from_numpy(self._offsets[a][envs] + node)] = \
+                    th.from_numpy(index[envs] == 0)
+
+    def _restructure(self, index, params):
+
+        """
+        Applies the merge and split actions of every episode, as a single gather over the batched clusters.
+
+        Parameters
+        ----------
+
+        index: numpy array
+            Action index of each episode.
+        params: numpy array
+            Action parameters of each episode, [cluster1, cluster2] or [cluster], range: [0, 1]
+
+        """
+
+        if self.defined:
+            return
+
+        capacity = self._capacity
+        nclusters = self._nclusters
+
+        c1 = np.rint(params[:, 0] * (nclusters - 1)).astype(np.int64)
+        c2 = np.rint(params[:, 1] * (nclusters - 1)).astype(np.int64)
+
+        merge = (index == 2) & (c1 != c2)
+        split = (index == 3) & (nclusters < capacity)
+
+        if not (merge.any() or split.any()):
+            return
+
+        # extra rows: merged or first split cluster, second split cluster, empty cluster
+        merged, second, empty = capacity, capacity + 1, capacity + 2
+
+        order = np.tile(np.arange(capacity)[:, None], (1, self.num_envs))
+
+        for i in np.flatnonzero(merge):
+            kept = [k for k in range(nclusters[i]) if k not in (c1[i], c2[i])]
+            order[:, i] = kept + [merged] + [empty for _ in range(capacity - len(kept) - 1)]
+
+        for i in np.flatnonzero(split):
+            kept = [k for k in range(nclusters[i]) if k != c1[i]]
+            order[:, i] = kept + [merged, second] + [empty for _ in range(capacity - len(kept) - 2)]
+
+        c2 = np.where(merge, c2, c1)
+
+        for a in range(len(self._ntypes)):
+
+            node_env = self._node_env[a]
+            membership = self._membership[a]
+            nodes = th.arange(membership.shape[1])
+
+            # select partition point
+            point = np.zeros(self.num_envs, dtype=np.int64)
+            for i in np.flatnonzero(split):
+                point[i] = self.np_random.randint(low=0, high=self._nnodes[a][i], dtype=np.int32)
+
+            first = membership[th.from_numpy(c1)[node_env], nodes]
+            last = membership[th.from_numpy(c2)[node_env], nodes]
+
+            before = (nodes - th.from_numpy(self._offsets[a][:-1])[node_env]) < th.from_numpy(point)[node_env]
+            is_merge = th.from_numpy(merge)[node_env]
+
+            extended = th.cat([
+                membership,
+                th.where(is_merge, first | last, first & before)[None],
+                (last & ~before)[None],
+                th.zeros((1, membership.shape[1]), dtype=th.bool)
+            ])
+
+            membership.copy_(th.gather(extended, 0, th.from_numpy(order)[:, node_env]))
+
+        self._nclusters = nclusters - merge + split
+
+    def _volume_match(self):
+
+        """
+        Returns the volume match of every episode.
+
+        Returns
+        -------
+
+            numpy array
+                Current volume match, **Shape**: (num_envs,).
+
+        """
+
+        # only the members of every hidden cluster are gathered, instead of every (node, cluster) pair
+        intersection = th.zeros((self.num_envs, self._capacity, self._max_hclusters), dtype=th.float64)
+
+        for f, hnodes in zip(self._membership, self._hnodes):
+            for k, (nodes, envs) in enumerate(hnodes):
+                intersection[:, :, k] += th.zeros((self.num_envs, self._capacity), dtype=th.float64).index_add_(
+                    0, envs, f[:, nodes].T.double()
+                )
+
+        fsize = self._segment_sum(self._membership).double()
+
+        union = fsize[:, :, None] + self._hsize.double()[:, None, :] - intersection
+        cost = (1 - intersection / union.clamp(min=1)).numpy()
+
+        res = np.zeros(self.num_envs)
+
+        for i in range(self.num_envs):
+            cost_matrix = cost[i, :self._nclusters[i], :self._nhclusters[i]]
+            row_ind, col_ind = linear_sum_assignment(cost_matrix)
+            res[i] = (cost_matrix[row_ind, col_ind] * self._coverage[i, col_ind]).sum()
+
+        return res
+
+    @property
+    def state(self):
+
+        """
+        Returns the batched state.
+
+        Returns
+        -------
+
+            dict
+                State, with a batched graph and one action mask per episode.
+
+        """
+
+        active = np.arange(self._capacity)[None, :] < self._nclusters[:, None]
+
+        add = np.zeros(self.num_envs, dtype=bool)
+        remove = np.zeros(self.num_envs, dtype=bool)
+
+        for a in range(len(self._ntypes)):
+            size = th.zeros((self.num_envs, self._capacity)).index_add_(
+                0, self._node_env[a], self._membership[a].T.float()
+            ).numpy()
+
+            add |= (active & (size < self._nnodes[a][:, None])).any(1)
+            remove |= (active & (size > 0)).any(1)
+
+        if self.defined:
+            mask = np.stack([add, remove, np.zeros_like(add), np.zeros_like(add)], 1)
+
+        else:
+            mask = np.stack([add, remove, self._nclusters > 1, self._nclusters < self._capacity], 1)
+
+        return {
+            "action_mask": mask.astype(np.float32),
+            "avail_actions": np.ones(mask.shape, dtype=np.float32),
+            "state": self._graph
+        }
+
+    def step(self, actions):
+
+        """
+        Runs one timestep of every episode. Episodes that end are reset, and their initial observation is returned in
+        the batched observation.
+
+        Parameters
+        ----------
+
+        actions: tuple
+            Batched actions provided by the agent, (actions indexes, actions parameters), with shapes (num_envs,) and
+            (num_envs, 4, nparams).
+
+        Returns
+        -------
+
+            object
+                Batched observation of the current environments.
+            numpy array
+                Reward of each episode.
+            numpy array
+                Whether each episode has ended (and was reset).
+            list[dict]
+                Auxiliary diagnostic information of each episode.
+
+        """
+
+        index = np.asarray(actions[0], dtype=np.int64)
+        params = np.asarray(actions[1], dtype=np.float64)
+        params = np.clip(params[np.arange(self.num_envs), index], 0.0, 1.0)
+
+        self._current_step += 1
+
+        # Take actions
+        self._set_nodes(index, params)
+        self._restructure(index, params)
+
+        # calculate volume match
+        self._last_distances = np.roll(self._last_distances, -1, axis=1)
+        self._last_distances[:, -1] = self._volume_match()
+
+        # check state
+        solved = self._last_distances[:, -1] == 0.0
+        error = ~solved & (self._last_distances.mean(1) <= self.target)
+        timeout = ~solved & ~error & (self._current_step > self.max_steps)
+
+        rewards = (self._last_distances[:, -2] - self._last_distances[:, -1]) - self.penalty
+        rewards += np.where(solved | error, 2 * self._reward_shaping, 0.0)
+        rewards -= np.where(error, self._reward_shaping, 0.0)
+        rewards = np.where(timeout, -1.0 * self._reward_shaping, rewards)
+
+        dones = solved | error | timeout
+
+        infos = [{} for _ in range(self.num_envs)]
+
+        for i in np.flatnonzero(dones):
+            infos[i]['steps'] = int(self._current_step[i])
+            infos[i]['distance'] = float(self._last_distances[i, -1])
+
+        if dones.any():
+            self._reset_envs(np.flatnonzero(dones))
+
+        return self.state, rewards, dones, infos
+
+    def reset(self):
+
+        """
+        Resets every episode and returns the initial batched observation.
+
+        Returns
+        -------
+            observation (object)
+                The initial batched observation.
+        """
+
+        self._membership = None
+        self._ntypes = None
+        self._reset_envs(np.arange(self.num_envs))
+
+        return self.state
@@ -1,7 +1,12 @@
 
 from . import actions
+from . import bitset
 from . import datasets
+from . import generation
 from . import helper
 from . import metrics
+from . import observations
 from . import spaces
-from . import states
\ No newline at end of file
+from . import sparsify
+from . import states
+from . import timing
@@ -69,3 +69,45 @@ class Action:
         """
 
         return [float(max(min(param, 1.0), 0.0)) for param in self._parameters[self.index]]
+
+
+class RangeAction(Action):
+    """
+    Action class that adds or removes a contiguous range of nodes of every ntype at once, instead of a single node.
+    """
+
+    # parameters of every action
+    nparams = 7
+
+    def __init__(self, index, params, labels=None):
+        """
+
+        Parameters
+        ----------
+
+        index: int
+            The index of the selected action.
+
+            ======== ===========
+               Range Actions
+            --------------------
+            index    action
+            ======== ===========
+            0        add_range
+            1        remove_range
+            2        merge
+            3        split
+            ======== ===========
+
+        params: list[list[floats]]
+            The parameters of the actions. Range actions take [cluster, start, stop] followed by the start and stop
+            of the remaining ntypes (ignored if the state has fewer ntypes), see `State.add_range`.
+
+            **Range**: [0, 1]
+
+        """
+
+        if labels is None:
+            labels = ['add_range', 'remove_range', 'merge', 'split']
+
+        super(RangeAction, self).__init__(index, params, labels)
@@ -0,0 +1,265 @@
+import numpy as np
+import torch as th
+
+# number of set bits of every byte
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+
+_ONE = np.uint64(1)
+
+
+def nwords(n):
+
+    """Returns the number of 64 bit words needed to store `n` bits"""
+
+    return (n + 63) // 64
+
+
+def pack(mask):
+
+    """
+    Packs a bool matrix into 64 bit words, bit `i` of a row is stored in bit `i % 64` of word `i // 64`.
+
+    Parameters
+    ----------
+
+    mask: tensor or numpy array
+        Bool matrix, **Shape**: (nrows, nbits).
+
+    Returns
+    -------
+
+        numpy array
+            Packed matrix, **Shape**: (nrows, nwords), **dtype**: uint64.
+
+    """
+
+    if isinstance(mask, th.Tensor):
+        mask = mask.cpu().numpy()
+
+    nrows, nbits = mask.shape
+
+    packed = np.zeros((nrows, nwords(nbits) * 8), dtype=np.uint8)
+    packed[:, :(nbits + 7) // 8] = np.packbits(mask.astype(bool), axis=1, bitorder='little')
+
+    return packed.view('<u8')
+
+
+def unpack(words, nbits):
+
+    """
+    Unpacks 64 bit words into a bool matrix, the inverse of `pack`.
+
+    Parameters
+    ----------
+
+    words: numpy array
+        Packed matrix, **Shape**: (nrows, nwords).
+    nbits: int
+        Number of bits of every row.
+
+    Returns
+    -------
+
+        numpy array
+            Bool matrix, **Shape**: (nrows, nbits).
+
+    """
+
+    words = np.ascontiguousarray(words, dtype='<u8')
+
+    return np.unpackbits(words.view(np.uint8), axis=1, count=nbits, bitorder='little').astype(bool)
+
+
+def popcount(words):
+
+    """Returns the number of set bits of every row of a packed matrix"""
+
+    return _POPCOUNT[np.ascontiguousarray(words, dtype='<u8').view(np.uint8)].sum(1)
+
+
+def prefix(index, nbits):
+
+    """Returns the packed row with the bits below `index` set"""
+
+    return pack(np.arange(nbits)[None, :] < index)[0]
+
+
+class PackedMembership:
+
+    """
+    Cluster membership packed as bits, one (nclusters, nwords) uint64 array per axis. Node edits are single bit
+    operations, and merging or splitting clusters works on words instead of bools.
+    """
+
+    def __init__(self, membership):
+
+        """
+        Parameters
+        ----------
+
+        membership: list[tensor]
+            Cluster membership, one bool tensor with shape (nclusters, nnodes) per axis.
+
+        Attributes
+        ----------
+
+        sizes: list[int]
+            Number of nodes of every axis.
+        words: list[numpy array]
+            Packed membership, one uint64 array with shape (nclusters, nwords) per axis.
+
+        """
+
+        self.sizes = [mask.shape[1] for mask in membership]
+        self.words = [pack(mask) for mask in membership]
+
+    @property
+    def nclusters(self):
+        return self.words[0].shape[0]
+
+    def get(self, axis, cluster, index):
+
+        """Returns if node `index` of `axis` belongs to `cluster`"""
+
+        return bool((self.words[axis][cluster, index >> 6] >> np.uint64(index & 63)) & _ONE)
+
+    def set(self, axis, cluster, index, x):
+
+        """Sets the membership of node `index` of `axis` in `cluster`"""
+
+        bit = _ONE << np.uint64(index & 63)
+
+        if x:
+            self.words[axis][cluster, index >> 6] |= bit
+        else:
+            self.words[axis][cluster, index >> 6] &= ~bit
+
+    def set_many(self, axis, cluster, index, x):
+
+        """
+        Sets the membership of several nodes of `axis` in `cluster` at once.
+
+        Parameters
+        ----------
+
+        axis: int
+            Index of the axis.
+        cluster: int
+            Index of the cluster.
+        index: numpy array
+            Index of the nodes, without repetitions.
+        x: bool
+            Value to set.
+
+        Returns
+        -------
+
+            numpy array
+                Index of the nodes that changed value.
+
+        """
+
+        row = unpack(self.words[axis][cluster:cluster + 1], self.sizes[axis])[0]
+        changed = index[row[index] != x]
+
+        bits = np.zeros(self.words[axis].shape[1], dtype=np.uint64)
+        np.bitwise_or.at(bits, changed >> 6, _ONE << (changed & 63).astype(np.uint64))
+
+        if x:
+            self.words[axis][cluster] |= bits
+        else:
+            self.words[axis][cluster] &= ~bits
+
+        return changed
+
+    def counts(self):
+
+        """
+        Returns the number of members of every cluster.
+
+        Returns
+        -------
+
+            numpy array
+                Member counts, **Shape**: (naxis, nclusters).
+
+        """
+
+        return np.stack([popcount(words) for words in self.words])
+
+    def _restructure(self, removed, added):
+
+        self.words = [
+            np.concatenate((np.delete(words, removed, axis=0), np.stack(new)))
+            for words, new in zip(self.words, added)
+        ]
+
+        return [[int(popcount(row[None])[0]) for row in new] for new in zip(*added)]
+
+    def merge(self, cluster1, cluster2):
+
+        """
+        Replaces two clusters by their union, appended after the remaining clusters.
+
+        Returns
+        -------
+
+            list[list[int]]
+                Member counts of the new cluster, by axis.
+
+        """
+
+        return self._restructure([cluster1, cluster2], [[words[cluster1] | words[cluster2]] for words in self.words])
+
+    def split(self, cluster, index):
+
+        """
+        Replaces a cluster by two clusters, the nodes below the partition point of every axis and the remaining nodes,
+        appended after the remaining clusters.
+
+        Parameters
+        ----------
+
+        cluster: int
+            Index of the cluster to split.
+        index: list[int]
+            Partition point of every axis.
+
+        Returns
+        -------
+
+            list[list[int]]
+                Member counts of the new clusters, by axis.
+
+        """
+
+        added = []
+
+        for words, point, size in zip(self.words, index, self.sizes):
+            below = prefix(point, size)
+            added.append([words[cluster] & below, words[cluster] & ~below])
+
+        return self._restructure([cluster], added)
+
+    def copy(self):
+
+        """Returns a copy, updated independently"""
+
+        packed = PackedMembership.__new__(PackedMembership)
+
+        packed.sizes = self.sizes
+        packed.words = [words.copy() for words in self.words]
+
+        return packed
+
+    def row(self, axis, cluster):
+
+        """Returns the membership of a cluster in an axis as a bool tensor"""
+
+        return th.from_numpy(unpack(self.words[axis][cluster:cluster + 1], self.sizes[axis])[0])
+
+    def tensors(self):
+
+        """Returns the membership as bool tensors, one with shape (nclusters, nnodes) per axis"""
+
+        return [th.from_numpy(unpack(words, size)) for words, size in zip(self.words, self.sizes)]
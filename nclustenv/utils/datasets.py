@@ -1,13 +1,16 @@
 
 from dgl.data import DGLDataset
 import numpy as np
+import torch as th
 
 from nclustenv.utils.spaces import DGLHeteroGraphSpace
-from nclustenv.utils.helper import parse_ds_settings
-from nclustenv.utils.states import State
+from nclustenv.utils.helper import parse_ds_settings, dense_to_dgl, dgl_to_dense
+from nclustenv.utils.generation import generate_shard
 
 import os
-from dgl import save_graphs, load_graphs
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dgl import load_graphs
 from dgl.data.utils import save_info, load_info
 
 
@@ -15,8 +18,16 @@ class SyntheticDataset(DGLDataset):
 
     """
     Implementation of a DGLDataset, that creates a synthetic dataset with a given number of examples.
+
+    Datasets are saved in a columnar format: the edge weights of every example, their shapes and their hidden clusters
+    are stored as flat arrays with offsets, which are memory-mapped on load. Examples are only built into graphs when
+    accessed, so processes loading the same dataset share it through the page cache. Datasets saved with
+    `dgl.save_graphs` (graphs and labels pickled together) are still loaded, in memory.
     """
 
+    # Columnar arrays, saved as `{name}_{column}.npy`
+    _columns = ['weights', 'offsets', 'shapes', 'labels', 'label_offsets', 'cluster_offsets']
+
     def __init__(
             self,
             length=10,
@@ -28,6 +39,7 @@ class SyntheticDataset(DGLDataset):
             name='synthetic',
             save_dir=None,
             verbose=False,
+            workers=1,
             *args, **kwargs
     ):
         """
@@ -70,14 +82,17 @@ class SyntheticDataset(DGLDataset):
             Directory to save the processed dataset.
         verbose: bool, default False
             Whether to print out progress information.
+        workers: int, default 1
+            Number of processes generating the dataset, each one builds a contiguous shard of examples. The generated
+            dataset only depends on `seed`, not on the number of workers.
 
         Attributes
         ----------
 
         graphs: list
-            Dataset's Graphs.
+            Dataset's Graphs, if held in memory (None if the dataset is memory-mapped).
         labels: list
-            Dataset's Labels.
+            Dataset's Labels, if held in memory (None if the dataset is memory-mapped).
 
         """
 
@@ -89,8 +104,10 @@ class SyntheticDataset(DGLDataset):
 
         self.graphs = None
         self.labels = None
+        self._arrays = None
 
         self._n = length
+        self._workers = max(int(workers), 1)
 
         np_random = np.random.RandomState(seed)
 
@@ -118,43 +135,101 @@ class SyntheticDataset(DGLDataset):
     def process(self):
 
         _observation_space = DGLHeteroGraphSpace(**self._observation_space)
-        _state = State(**self._state)
 
-        self.graphs = []
-        self.labels = []
+        # Every example is sampled upfront from the dataset's random object, so shards do not depend on the workers
+        samples = [_observation_space.sample() for _ in range(self._n)]
+        shards = [list(shard) for shard in np.array_split(np.arange(self._n), min(self._workers, max(self._n, 1)))]
+
+        if len(shards) > 1:
+            with ProcessPoolExecutor(
+                    max_workers=len(shards), mp_context=multiprocessing.get_context('spawn')
+            ) as executor:
+                examples = executor.map(
+                    generate_shard,
+                    [self._state['generator'] for _ in shards],
+                    [[samples[i] for i in shard] for shard in shards]
+                )
+                examples = [example for shard in examples for example in shard]
+
+        else:
+            examples = generate_shard(self._state['generator'], samples)
+
+        self.graphs = [graph for graph, _ in examples]
+        self.labels = [label for _, label in examples]
 
-        for _ in range(self._n):
-            _state.reset(*_observation_space.sample(), not_init=True)
-            self.graphs.append(_state.current)
-            self.labels.append(_state.hclusters)
+    def _path(self, column):
+        return os.path.join(self.save_path, '{}_{}.npy'.format(self.name, column))
+
+    def _open(self):
+        self._arrays = {column: np.load(self._path(column), mmap_mode='r') for column in self._columns}
 
     def save(self):
-        # save graphs and labels
-        graph_path = os.path.join(self.save_path, self.name + '_dgl_graph.bin')
-        save_graphs(graph_path, self.graphs)
+        # save graphs and labels as flat arrays, every example is a slice given by its offsets
+        weights = [dgl_to_dense(graph) for graph in self.graphs]
+        clusters = [cluster for label in self.labels for cluster in label]
+        segments = [np.asarray(axis, dtype=np.int64) for cluster in clusters for axis in cluster]
+
+        arrays = {
+            'weights': np.concatenate([x.reshape(-1) for x in weights]).astype(np.float32),
+            'offsets': np.cumsum([0] + [x.size for x in weights], dtype=np.int64),
+            'shapes': np.array([x.shape for x in weights], dtype=np.int64),
+            'labels': np.concatenate(segments) if segments else np.zeros(0, dtype=np.int64),
+            'label_offsets': np.cumsum([0] + [len(axis) for axis in segments], dtype=np.int64),
+            'cluster_offsets': np.cumsum([0] + [len(label) for label in self.labels], dtype=np.int64)
+        }
+
+        os.makedirs(self.save_path, exist_ok=True)
+
+        for column in self._columns:
+            np.save(self._path(column), arrays[column])
+
         # save other information in python dict
         info_path = os.path.join(self.save_path, self.name + '_info.pkl')
         save_info(info_path, {
-            'labels': self.labels,
             'observation_space': self._observation_space,
             'state': self._state
         })
 
     def load(self):
         # load processed data from directory `self.save_path`
-        graph_path = os.path.join(self.save_path, self.name + '_dgl_graph.bin')
-        self.graphs, label_dict = load_graphs(graph_path)
         info_path = os.path.join(self.save_path, self.name + '_info.pkl')
-        self.labels = load_info(info_path)['labels']
-        self._observation_space = load_info(info_path)['observation_space']
-        self._state = load_info(info_path)['state']
-        self._n = len(self.graphs)
+        info = load_info(info_path)
+
+        self._observation_space = info['observation_space']
+        self._state = info['state']
+
+        if 'labels' in info:
+            # datasets saved with dgl's graph format are held in memory
+            graph_path = os.path.join(self.save_path, self.name + '_dgl_graph.bin')
+            self.graphs, _ = load_graphs(graph_path)
+            self.labels = info['labels']
+            self._n = len(self.graphs)
+
+        else:
+            self._open()
+            self._n = len(self._arrays['shapes'])
 
     def has_cache(self):
         # check whether there are processed data in `self.save_path`
         graph_path = os.path.join(self.save_path, self.name + '_dgl_graph.bin')
         info_path = os.path.join(self.save_path, self.name + '_info.pkl')
-        return os.path.exists(graph_path) and os.path.exists(info_path)
+
+        columnar = all(os.path.exists(self._path(column)) for column in self._columns)
+
+        return os.path.exists(info_path) and (columnar or os.path.exists(graph_path))
+
+    def __getstate__(self):
+        # memory maps are reopened, not copied, by other processes
+        state = self.__dict__.copy()
+        state['_arrays'] = None if self._arrays is None else True
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+        if self._arrays is not None:
+            self._open()
 
     @property
     def shape(self):
@@ -201,7 +276,235 @@ class SyntheticDataset(DGLDataset):
         return self._observation_space['settings']
 
     def __getitem__(self, i):
-        return self.graphs[i], self.labels[i]
+
+        if self.graphs is not None:
+            return self.graphs[i], self.labels[i]
+
+        i = range(self._n)[int(i)]
+        arrays = self._arrays
+
+        x = np.array(arrays['weights'][arrays['offsets'][i]:arrays['offsets'][i + 1]]).reshape(arrays['shapes'][i])
+
+        dim = arrays['shapes'].shape[1]
+        first, last = arrays['cluster_offsets'][i], arrays['cluster_offsets'][i + 1]
+        bounds = np.array(arrays['label_offsets'][first * dim:last * dim + 1]) - arrays['label_offsets'][first * dim]
+        index = arrays['labels'][arrays['label_offsets'][first * dim]:arrays['label_offsets'][last * dim]].tolist()
+
+        label = [
+            [index[bounds[j * dim + axis]:bounds[j * dim + axis + 1]] for axis in range(dim)]
+            for j in range(last - first)
+        ]
+
+        return dense_to_dgl(x), label
 
     def __len__(self):
-        return len(self.graphs)
+        return self._n
+
+
+class StreamingDataset(th.utils.data.IterableDataset):
+
+    """
+    Iterable dataset that streams examples from a directory of saved datasets (shards), for corpora that do not fit in
+    memory. Shards are visited in a random order and their examples pass through a shuffle buffer, so only the
+    examples in the buffer are referenced at any time. The order of the shards only depends on the seed and the
+    epoch, so that dataloader workers, which stream disjoint shards, agree on it in every epoch.
+
+    Examples
+    --------
+    >>> for i in range(100):
+    >>>     SyntheticDataset(length=10000, shape=[[100, 10], [200, 50]], seed=i, name='shard{}'.format(i),
+    >>>                      save_dir='corpus')
+    >>> dataset = StreamingDataset('corpus')
+    """
+
+    def __init__(self, shards, buffer_size=1024, seed=None):
+
+        """
+        Parameters
+        ----------
+
+        shards: str or list[str]
+            Directory with the saved datasets (shards), or list of paths to the saved datasets.
+        buffer_size: int, default 1024
+            Number of examples in the shuffle buffer.
+        seed: int, default None
+            Seed to initialize random object.
+
+        """
+
+        if isinstance(shards, str):
+            root = shards
+            shards = [os.path.join(root, name) for name in sorted(os.listdir(root))]
+            shards = [shard for shard in shards if os.path.exists(self._info_path(shard))]
+
+        else:
+            shards = list(shards)
+
+        for shard in shards:
+            if not os.path.exists(self._info_path(shard)):
+                raise AttributeError('{} is not a saved dataset'.format(shard))
+
+        self.shards = shards
+        self._buffer_size = max(int(buffer_size), 1)
+        self._np_random = np.random.RandomState(seed)
+
+        # the seed is fixed before the dataset is sent to dataloader workers, and combined with the epoch
+        self._seed = int(np.random.randint(2 ** 31) if seed is None else seed)
+        self._epoch = 0
+
+        self._lengths = None
+
+    @staticmethod
+    def _info_path(shard):
+        return os.path.join(shard, os.path.basename(os.path.normpath(shard)) + '_info.pkl')
+
+    @staticmethod
+    def _open(shard):
+        shard = os.path.normpath(shard)
+        return SyntheticDataset(name=os.path.basename(shard), save_dir=os.path.dirname(shard))
+
+    def _bounds(self, key):
+
+        bounds = [load_info(self._info_path(shard))['observation_space'][key] for shard in self.shards]
+
+        return [
+            np.min([bound[0] for bound in bounds], axis=0).tolist(),
+            np.max([bound[1] for bound in bounds], axis=0).tolist()
+        ]
+
+    @property
+    def shape(self):
+
+        """
+        Returns the dataset's shape bounds, over all shards.
+
+        Returns
+        -------
+
+            list
+                Shape Bounds.
+        """
+
+        return self._bounds('shape')
+
+    @property
+    def clusters(self):
+
+        """
+        Returns the dataset's cluster bounds, over all shards.
+
+        Returns
+        -------
+
+            list
+                Cluster Bounds.
+        """
+
+        return self._bounds('clusters')
+
+    @property
+    def settings(self):
+
+        """
+        Returns the dataset's settings, as given by the first shard.
+
+        Returns
+        -------
+
+            dict
+                Dataset's settings.
+        """
+
+        return load_info(self._info_path(self.shards[0]))['observation_space']['settings']
+
+    def split(self, train_test_split=0.8):
+
+        """
+        Splits the dataset into two streams with disjoint shards.
+
+        Parameters
+        ----------
+
+        train_test_split: float, default 0.8
+            The percentage of shards in the first stream. Every stream gets at least one shard.
+
+        Returns
+        -------
+
+            tuple[StreamingDataset]
+                Train and test streams.
+
+        Raises
+        ------
+
+            ValueError
+                If a stream would have no shards (e.g. the dataset has a single shard).
+        """
+
+        num_train = min(max(int(len(self.shards) * train_test_split), 1), len(self.shards) - 1)
+
+        if num_train < 1:
+            raise ValueError(
+                'Cannot split {} shard(s) into two non-empty streams, save the dataset with more shards'.format(
+                    len(self.shards))
+            )
+
+        return (
+            StreamingDataset(self.shards[:num_train], self._buffer_size, self._np_random.randint(2 ** 31)),
+            StreamingDataset(self.shards[num_train:], self._buffer_size, self._np_random.randint(2 ** 31))
+        )
+
+    def _stream(self, shards):
+
+        for shard in shards:
+            dataset = self._open(shard)
+
+            for i in range(len(dataset)):
+                yield dataset, i
+
+    def __iter__(self):
+
+        # persistent dataloader workers keep their own copy of the dataset, so the epoch is counted in every copy
+        epoch = self._epoch
+        self._epoch += 1
+
+        worker = th.utils.data.get_worker_info()
+
+        # the base seed of the workers is shared by all of them, and renewed every epoch unless they are persistent
+        seed = [self._seed, epoch] if worker is None else [self._seed, epoch, (worker.seed - worker.id) % 2 ** 32]
+
+        # dataloader workers stream disjoint shards, of the same permutation
+        shards = [self.shards[i] for i in np.random.RandomState(seed).permutation(len(self.shards))]
+
+        if worker is not None:
+            shards = shards[worker.id::worker.num_workers]
+
+        # the shuffle buffer of every worker has its own random object
+        np_random = np.random.RandomState(seed + [0 if worker is None else worker.id + 1])
+
+        # the buffer holds references to examples, which are only built when they leave it
+        buffer = []
+
+        for example in self._stream(shards):
+
+            if len(buffer) < self._buffer_size:
+                buffer.append(example)
+                continue
+
+            j = np_random.randint(self._buffer_size)
+            dataset, i = buffer[j]
+            buffer[j] = example
+
+            yield dataset[i]
+
+        np_random.shuffle(buffer)
+
+        for dataset, i in buffer:
+            yield dataset[i]
+
+    def __len__(self):
+
+        if self._lengths is None:
+            self._lengths = [len(self._open(shard)) for shard in self.shards]
+
+        return sum(self._lengths)
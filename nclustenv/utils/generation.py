@@ -0,0 +1,229 @@
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .helper import loader, dense_to_dgl, resolve_device
+
+
+class Episode:
+
+    """
+    Container for a generated episode, exposing the same data as a nclustgen generator (`X`, `Y`, `graph` and
+    `coverage`) without holding any JVM object, so that it can be sent across processes.
+    """
+
+    def __init__(self, X, Y, graph, coverage, seed=None):
+
+        """
+        Parameters
+        ----------
+
+        X: numpy array
+            Generated dataset.
+        Y: list
+            Hidden cluster labels.
+        graph: dgl graph
+            Generated dataset as a graph, without initialized clusters.
+        coverage: float
+            Percentage of cluster coverage.
+        seed: int, default None
+            Seed used to generate the episode.
+
+        """
+
+        self.X = X
+        self.Y = Y
+        self.graph = graph
+        self.coverage = coverage
+        self.seed = seed
+
+    @property
+    def _n(self):
+        return len(self.X.shape)
+
+    def _is_view(self):
+
+        """Returns if the array is a view of the edge weights (dense construction)"""
+
+        weights = self.graph.edges[('row', 'elem', 'col')].data['w']
+
+        return isinstance(self.X, np.ndarray) and self.X.size > 0 and weights.device.type == 'cpu' \
+            and weights.data_ptr() == self.X.ctypes.data
+
+    def __getstate__(self):
+
+        state = self.__dict__.copy()
+
+        # an array that is a view of the edge weights is sent once, as the weights, and is a view again once received
+        if self._is_view():
+            state['X'] = self.X.shape
+
+        return state
+
+    def __setstate__(self, state):
+
+        self.__dict__.update(state)
+
+        if isinstance(self.X, tuple):
+            self.X = self.graph.edges[('row', 'elem', 'col')].data['w'].numpy().reshape(self.X)
+
+
+def generate(generator, shape, nclusters, settings=None, clust_init='zeros', construction='nclustgen', *args, **kwargs):
+
+    """
+    Generates an episode.
+
+    Parameters
+    ----------
+
+    generator: str or class
+        The name of a generator from the nclustgen tool, or the class for a personalised generator (not advised).
+    shape: list[int]
+        Shape of the episode.
+    nclusters: int
+        Number of hidden clusters.
+    settings: dict
+        Dataset settings (nclustgen).
+    clust_init: str or function, default 'zeros'
+        Not used, clusters are initialized by the state (as sampled by `DGLHeteroGraphSpace.sample`).
+    construction: {'nclustgen', 'dense'}, default 'nclustgen'
+        How the graph is built, see `State`.
+
+    Returns
+    -------
+
+        Episode
+            Generated episode, on the cpu.
+
+    """
+
+    import nclustgen
+
+    if settings is None:
+        settings = {}
+
+    _generator = loader(generator, nclustgen)(**settings)
+    _generator.generate(*shape, nclusters=nclusters)
+
+    if construction == 'dense':
+        # the edge weights are a view of the float32 array
+        x = np.ascontiguousarray(_generator.X, dtype=np.float32)
+
+        return Episode(x, _generator.Y, dense_to_dgl(x), _generator.coverage, settings.get('seed'))
+
+    _generator.to_graph(framework='dgl', device='cpu', nclusters=0)
+
+    return Episode(_generator.X, _generator.Y, _generator.graph, _generator.coverage, settings.get('seed'))
+
+
+def generate_shard(generator, samples):
+
+    """
+    Generates a shard of episodes.
+
+    Parameters
+    ----------
+
+    generator: str or class
+        The name of a generator from the nclustgen tool, or the class for a personalised generator (not advised).
+    samples: list
+        Arguments of `generate` for every episode in the shard.
+
+    Returns
+    -------
+
+        list[tuple]
+            Graph and hidden cluster labels of every episode.
+
+    """
+
+    episodes = [generate(generator, *sample) for sample in samples]
+
+    return [(episode.graph, episode.Y) for episode in episodes]
+
+
+class EpisodePool:
+
+    """
+    Bounded queue of episodes generated ahead of time by a pool of worker processes.
+
+    The episode settings are sampled in the calling process, in the same order episodes are popped, so that the
+    sequence of episodes only depends on the random object used by `sampler`.
+    """
+
+    def __init__(self, generator, sampler, size=4, workers=None, construction='nclustgen', device=None):
+
+        """
+        Parameters
+        ----------
+
+        generator: str or class
+            The name of a generator from the nclustgen tool, or the class for a personalised generator (not advised).
+        sampler: callable
+            Function returning the arguments of `generate` for a new episode, e.g. `DGLHeteroGraphSpace.sample`.
+        size: int, default 4
+            Number of episodes kept ready (or being generated).
+        workers: int, default None
+            Number of worker processes, if None it defaults to `size`.
+        construction: {'nclustgen', 'dense'}, default 'nclustgen'
+            How the workers build the graphs, see `State`.
+        device: str or torch device, default None
+            Device episodes are moved to when popped. Workers build them on the cpu, as they are sent across
+            processes. If None they are kept on the cpu.
+
+        """
+
+        self._generator = generator
+        self._sampler = sampler
+        self._size = max(int(size), 1)
+        self._construction = construction
+        self._device = resolve_device(device)
+
+        # Workers must not inherit a running JVM
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers or self._size, mp_context=multiprocessing.get_context('spawn')
+        )
+        self._queue = deque()
+
+        for _ in range(self._size):
+            self._submit()
+
+    def _submit(self):
+        self._queue.append(
+            self._executor.submit(generate, self._generator, *self._sampler(), construction=self._construction)
+        )
+
+    def pop(self):
+
+        """
+        Returns the oldest episode in the queue, waiting for it if necessary, and queues a new one.
+
+        Returns
+        -------
+
+            Episode
+                Generated episode.
+
+        """
+
+        episode = self._queue.popleft().result()
+        self._submit()
+
+        if self._device is not None and self._device.type != 'cpu':
+            episode.graph = episode.graph.to(self._device)
+
+        return episode
+
+    def close(self):
+
+        """
+        Stops the workers, discarding queued episodes.
+        """
+
+        for future in self._queue:
+            future.cancel()
+
+        self._queue.clear()
+        self._executor.shutdown(wait=False)
@@ -1,4 +1,8 @@
 import collections.abc
+import weakref
+
+import dgl
+import numpy as np
 import torch as th
 
 def index_to_matrix(x, index):
@@ -61,16 +65,287 @@ def real_to_ind(x, param):
     return int(round(param * (len(x)-1), 0))
 
 
+def membership_from_graph(graph, ntypes):
+
+    """Returns the clusters of a graph as a list of bool tensors (nclusters, nnodes), one per ntype"""
+
+    keys = [key for key in graph.nodes[ntypes[0]].data.keys()]
+
+    if not keys:
+        return [th.zeros((0, graph.num_nodes(ntype)), dtype=th.bool, device=graph.device) for ntype in ntypes]
+
+    return [th.stack([graph.nodes[ntype].data[j] for j in keys]) for ntype in ntypes]
+
+
+def membership_from_clusters(clusters, sizes, device=None):
+
+    """Returns a list of clusters as bool tensors (nclusters, nnodes), one per axis of length `sizes[axis]`"""
+
+    membership = []
+
+    for axis, size in enumerate(sizes):
+        mask = th.zeros((len(clusters), size), dtype=th.bool, device=device)
+
+        for j, cluster in enumerate(clusters):
+            mask[j, th.tensor([int(i) for i in cluster[axis]], dtype=th.long, device=device)] = True
+
+        membership.append(mask)
+
+    return membership
+
+
+def index_from_membership(membership):
+
+    """Returns the clusters of a membership list as index tensors, shape (nclusters, ntypes)"""
+
+    nclusters = membership[0].shape[0]
+    axes = []
+
+    for mask in membership:
+        # nonzero is row major, so indexes come out grouped by cluster and sorted
+        index = mask.nonzero()[:, 1]
+        axes.append(th.split(index, mask.sum(1).tolist()) if nclusters else ())
+
+    return [[axis[j] for axis in axes] for j in range(nclusters)]
+
+
+def clusters_from_membership(membership):
+
+    """Returns the clusters of a membership list as a list of lists"""
+
+    nclusters = membership[0].shape[0]
+    axes = []
+
+    for mask in membership:
+        index = mask.nonzero()[:, 1].tolist()
+        bounds = np.concatenate(([0], np.cumsum(mask.sum(1).tolist(), dtype=np.int64)))
+        axes.append([index[bounds[j]:bounds[j + 1]] for j in range(nclusters)])
+
+    return [[axis[j] for axis in axes] for j in range(nclusters)]
+
+
 def clusters_from_bool(graph, ntypes):
 
     """Returns the clusters of a graph as a list of lists"""
 
-    keys = [key for key in graph.nodes[ntypes[0]].data.keys()]
+    return clusters_from_membership(membership_from_graph(graph, ntypes))
+
+
+def dense_to_dgl(x, dtype=th.float32):
+
+    """
+    Builds the n-partite graph of a dense array, with the same nodes, edges (and edge order) as nclustgen's `to_graph`,
+    without iterating over the array's elements. Node ids are generated as int32 without intermediate arrays, and every
+    etype shares the same weights tensor, which shares memory with `x` if it is contiguous and of type `dtype`.
+
+    Parameters
+    ----------
+
+    x: numpy array or tensor
+        Data array, with shape (nrows, ncols) or (ncontexts, nrows, ncols).
+    dtype: torch dtype, default torch.float32
+        Type of the edge weights, if None the type of `x` is kept.
+
+    Returns
+    -------
+
+        heterograph object
+            Array as a bipartite or tripartite dgl graph.
+
+    """
+
+    shape = tuple(x.shape)
+    weights = th.as_tensor(x, dtype=dtype).reshape(-1)
+
+    def axis_ids(n, inner, outer):
+        # ids of an axis of size n in C order, with `inner` cells per id and the sequence repeated `outer` times
+        return th.arange(n, dtype=th.int32).repeat_interleave(inner).repeat(outer)
+
+    if len(shape) == 2:
+        nodes = {'row': shape[0], 'col': shape[1]}
+        ids = {'row': axis_ids(shape[0], shape[1], 1), 'col': axis_ids(shape[1], 1, shape[0])}
+        etypes = [('row', 'elem', 'col')]
+
+    else:
+        nodes = {'ctx': shape[0], 'row': shape[1], 'col': shape[2]}
+        ids = {
+            'ctx': axis_ids(shape[0], shape[1] * shape[2], 1),
+            'row': axis_ids(shape[1], shape[2], shape[0]),
+            'col': axis_ids(shape[2], 1, shape[0] * shape[1])
+        }
+        etypes = [('row', 'elem', 'col'), ('row', 'elem', 'ctx'), ('col', 'elem', 'ctx')]
+
+    graph = dgl.heterograph(
+        {etype: (ids[etype[0]], ids[etype[2]]) for etype in etypes},
+        num_nodes_dict=nodes,
+        idtype=th.int32
+    )
+
+    for etype in etypes:
+        graph.edges[etype].data['w'] = weights
+
+    return graph
+
+
+def dgl_to_dense(graph):
+
+    """
+    Returns the dense array of an n-partite graph, the inverse of `dense_to_dgl`.
+
+    Parameters
+    ----------
+
+    graph: heterograph object
+        Bipartite or tripartite dgl graph, where the nth edge of every etype connects the nodes of the same element.
+
+    Returns
+    -------
+
+        numpy array
+            Data array, with shape (nrows, ncols) or (ncontexts, nrows, ncols).
+
+    """
+
+    rows, cols = graph.edges(etype=('row', 'elem', 'col'))
+    weights = graph.edges[('row', 'elem', 'col')].data['w'].cpu().float()
+
+    if 'ctx' in graph.ntypes:
+        _, ctxs = graph.edges(etype=('row', 'elem', 'ctx'))
+        x = th.zeros((graph.num_nodes('ctx'), graph.num_nodes('row'), graph.num_nodes('col')), dtype=th.float32)
+        x[ctxs.long().cpu(), rows.long().cpu(), cols.long().cpu()] = weights
+
+    else:
+        x = th.zeros((graph.num_nodes('row'), graph.num_nodes('col')), dtype=th.float32)
+        x[rows.long().cpu(), cols.long().cpu()] = weights
+
+    return x.numpy()
+
+
+# statistics of the edge weights of every live graph, see `edge_stats`
+_edge_stats = weakref.WeakKeyDictionary()
+
+
+def edge_weights(graph):
+
+    """Returns the distinct edge weight tensors of a graph (etypes may share the same tensor)"""
+
+    weights = {}
+
+    for etype in graph.canonical_etypes:
+        w = graph.edges[etype].data['w']
+        weights.setdefault((w.data_ptr(), w.shape), w)
+
+    return list(weights.values())
+
+
+def edge_stats(graph, unique=False):
+
+    """
+    Returns the statistics of the edge weights of a graph, computed once and cached while the graph is alive. Edge
+    weights are expected not to change after the first call (e.g. they are fixed for an episode).
+
+    Parameters
+    ----------
+
+    graph: heterograph object
+        Graph with edge weights `w`.
+    unique: bool, default False
+        If the sorted distinct edge weights should also be returned (computed on first request).
+
+    Returns
+    -------
+
+        dict
+            Minimum (`min`), maximum (`max`), if all weights are real (`isreal`) and, if requested, the distinct
+            weights (`unique`).
+
+    """
+
+    stats = _edge_stats.get(graph)
+
+    if stats is None:
+        weights = edge_weights(graph)
+
+        stats = _edge_stats[graph] = {
+            'min': min(w.min().item() for w in weights),
+            'max': max(w.max().item() for w in weights),
+            'isreal': all(w.isreal().all().item() for w in weights)
+        }
+
+    if unique and 'unique' not in stats:
+        stats['unique'] = th.unique(th.cat([w.reshape(-1) for w in edge_weights(graph)]))
+
+    return stats
+
+
+def resolve_device(device):
+
+    """
+    Returns a torch device, with a bare 'cuda' resolved to the current cuda device. The cuda runtime is only queried
+    for cuda devices.
+
+    Parameters
+    ----------
+
+    device: str or torch device
+        Device, if None it is kept.
+
+    Returns
+    -------
+
+        torch device
+            Resolved device, or None.
+
+    """
+
+    if device is None:
+        return None
+
+    device = th.device(device)
+
+    if device.type == 'cuda' and device.index is None:
+        device = th.device('cuda', th.cuda.current_device())
+
+    return device
+
+
+def share_graph(graph, share_memory=True):
+
+    """
+    Returns a graph sharing the structure, edge weights and edge statistics of another, without its node data. The
+    edge weights are moved to shared memory, so that they are not copied when sent to other processes.
+
+    Parameters
+    ----------
+
+    graph: heterograph object
+        Graph with edge weights `w`, fixed for its lifetime.
+    share_memory: bool, default True
+        If the edge weights are moved to shared memory. Moving them copies them, so weights that are a view of an
+        array (e.g. of dense construction) should be kept in place.
+
+    Returns
+    -------
+
+        heterograph object
+            Graph without node data, whose node data can be set without affecting `graph`.
+
+    """
+
+    if share_memory:
+        for w in edge_weights(graph):
+            w.share_memory_()
+
+    # local_var shares structure and features, without reflecting changes on the original graph
+    shared = graph.local_var()
+
+    for ntype in shared.ntypes:
+        for key in list(shared.nodes[ntype].data.keys()):
+            shared.nodes[ntype].data.pop(key)
+
+    _edge_stats[shared] = edge_stats(graph)
 
-    return [[[i
-              for i, val in enumerate(graph.nodes[ntype].data[j]) if val]
-             for ntype in ntypes]
-            for j in keys]
+    return shared
 
 
 def parse_ds_settings(settings, enforced=None):
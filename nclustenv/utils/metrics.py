@@ -1,3 +1,4 @@
+import copy
 import numpy as np
 
 
@@ -19,3 +20,131 @@ def match_score(fclusts, hclusts):
     (hidden clusters).
     """
     return np.array([[1-IoU(x, y) for y in hclusts] for x in fclusts])
+
+
+def batched_match_score(fmembership, hmembership):
+
+    """
+    Batched implementation of `match_score`, that takes the found and hidden clusters as bool membership tensors (one
+    tensor with shape (nclusters, nnodes) per ntype) and computes the whole distance matrix with matrix products.
+    """
+
+    intersection = sum(f.float() @ h.float().T for f, h in zip(fmembership, hmembership)).double()
+    fsize = sum(f.sum(1) for f in fmembership).double()
+    hsize = sum(h.sum(1) for h in hmembership).double()
+
+    union = fsize[:, None] + hsize[None, :] - intersection
+
+    return (1 - intersection / union.clamp(min=1)).cpu().numpy()
+
+
+class IncrementalMatchScore:
+
+    """
+    Incremental implementation of `match_score`. Keeps the intersection and size of every found cluster against every
+    hidden cluster, so that node edits update the distance matrix in O(nhclusters) instead of rescanning the clusters.
+    """
+
+    def __init__(self, fmembership, hmembership):
+
+        """
+        Parameters
+        ----------
+
+        fmembership: list[tensor]
+            Found clusters membership, one bool tensor with shape (nclusters, nnodes) per ntype.
+        hmembership: list[tensor]
+            Hidden clusters membership, one bool tensor with shape (nhclusters, nnodes) per ntype.
+
+        Attributes
+        ----------
+
+        hmembership: list[tensor]
+            Hidden clusters membership the distances are computed against.
+        cost_matrix: numpy array
+            Current distance between every found and hidden cluster.
+
+        """
+
+        self.hmembership = hmembership
+
+        # hidden membership by node, so that a node's row holds the hidden clusters it belongs to
+        self._hnodes = [h.T.cpu().numpy().astype(np.int64) for h in hmembership]
+
+        self._intersection = sum(
+            f.float() @ h.float().T for f, h in zip(fmembership, hmembership)
+        ).cpu().numpy().astype(np.int64)
+        self._fsize = sum(f.sum(1) for f in fmembership).cpu().numpy().astype(np.int64)
+        self._hsize = sum(h.sum(0) for h in self._hnodes)
+
+        self.cost_matrix = self._distance(self._intersection, self._fsize[:, None])
+
+    def _distance(self, intersection, fsize):
+
+        union = fsize + self._hsize - intersection
+
+        return 1 - intersection / np.maximum(union, 1)
+
+    def update(self, edits):
+
+        """
+        Applies membership edits to the distance matrix.
+
+        Parameters
+        ----------
+
+        edits: list
+            List of (axis, cluster, index, value) edits, as returned by `State.pop_edits`.
+
+        Returns
+        -------
+
+            dict
+                The previous distances of every updated found cluster, by cluster index.
+
+        """
+
+        previous = {}
+
+        for axis, cluster, index, x in edits:
+
+            if cluster not in previous:
+                previous[cluster] = self.cost_matrix[cluster].copy()
+
+            index = np.atleast_1d(index)
+            sign = 1 if x else -1
+
+            self._intersection[cluster] += sign * self._hnodes[axis][index].sum(0)
+            self._fsize[cluster] += sign * len(index)
+
+        for cluster in previous:
+            self.cost_matrix[cluster] = self._distance(self._intersection[cluster], self._fsize[cluster])
+
+        return previous
+
+    def copy(self):
+
+        """
+        Returns a copy that is updated independently, sharing the hidden clusters.
+
+        Returns
+        -------
+
+            IncrementalMatchScore
+                Copy of the current distances.
+
+        """
+
+        tracker = copy.copy(self)
+
+        tracker._intersection = self._intersection.copy()
+        tracker._fsize = self._fsize.copy()
+        tracker.cost_matrix = self.cost_matrix.copy()
+
+        return tracker
+
+
+# Metrics with a batched or incremental implementation expose it, so that the environment can skip building python
+# lists or rescanning clusters
+match_score.batched = batched_match_score
+match_score.incremental = IncrementalMatchScore
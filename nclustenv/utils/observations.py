@@ -0,0 +1,165 @@
+import numpy as np
+
+
+class GraphView:
+
+    """
+    Snapshot of a state observation. Shares the episode's graph structure and edge weights, which do not change within
+    an episode, and holds its own copy of the cluster membership, so that storing it costs O(nodes x clusters) instead
+    of O(edges). The full graph is only built when requested.
+    """
+
+    def __init__(self, base, ntypes, membership):
+
+        """
+        Parameters
+        ----------
+
+        base: dgl graph
+            Episode graph, only its structure and edge weights are read.
+        ntypes: list[str]
+            Ordered node types, as in `State`.
+        membership: list[tensor]
+            Cluster membership snapshot, one bool tensor with shape (nclusters, nnodes) per ntype.
+
+        Attributes
+        ----------
+
+        membership: list[tensor]
+            Cluster membership snapshot, one bool tensor with shape (nclusters, nnodes) per ntype.
+
+        """
+
+        self.membership = membership
+
+        self._base = base
+        self._ntypes = ntypes
+        self._graph = None
+
+    @property
+    def base(self):
+        return self._base
+
+    @property
+    def ntypes(self):
+        return self._ntypes
+
+    @property
+    def nclusters(self):
+        return self.membership[0].shape[0]
+
+    @property
+    def graph(self):
+
+        """
+        Returns the observation as a dgl graph, built on first access.
+
+        Returns
+        -------
+
+            dgl graph
+                Graph sharing the episode's structure and edge weights, with the snapshot clusters as node data.
+
+        """
+
+        if self._graph is None:
+
+            # local_var shares structure and features, without reflecting changes on the episode graph
+            graph = self._base.local_var()
+
+            for key in list(graph.nodes[self._ntypes[0]].data.keys()):
+                graph.ndata.pop(key)
+
+            for axis, ntype in enumerate(self._ntypes):
+                for j in range(self.nclusters):
+                    graph.nodes[ntype].data[j] = self.membership[axis][j]
+
+            self._graph = graph
+
+        return self._graph
+
+
+class DenseObservation:
+
+    """
+    Dense observation, for policies over the raw data instead of graphs. The episode values and the cluster membership
+    of every ntype are kept in arrays preallocated to a maximum shape, which the state updates in place, so the arrays
+    returned by `observation` are overwritten by later steps and should be copied to be stored.
+    """
+
+    def __init__(self, shape, max_clusters):
+
+        """
+        Parameters
+        ----------
+
+        shape: list[int]
+            Maximum number of nodes of every ntype, as in `State`.
+        max_clusters: int
+            Maximum number of found clusters.
+
+        Attributes
+        ----------
+
+        values: numpy array
+            Episode values, zero padded, **Shape**: shape, **dtype**: float32.
+        shape: numpy array
+            Episode shape, **Shape**: (ntypes,).
+        clusters: tuple[numpy array]
+            Cluster membership, zero padded, one bool array with shape (max_clusters, max nnodes) per ntype.
+        nclusters: int
+            Number of found clusters.
+
+        """
+
+        self.values = np.zeros(shape, dtype=np.float32)
+        self.shape = np.zeros(len(shape), dtype=np.int32)
+        self.clusters = tuple(np.zeros((max_clusters, size), dtype=bool) for size in shape)
+        self.nclusters = 0
+
+    def fits(self, shape, nclusters):
+
+        """Returns if an episode with the given shape and number of clusters fits the arrays"""
+
+        return all(size <= limit for size, limit in zip(shape, self.values.shape)) \
+            and nclusters <= self.clusters[0].shape[0]
+
+    def load_values(self, x):
+
+        """Writes the values of a new episode, with ntypes as axes"""
+
+        self.values.fill(0.0)
+        self.values[tuple(slice(0, size) for size in x.shape)] = x
+        self.shape[:] = x.shape
+
+    def load_clusters(self, membership):
+
+        """Writes the cluster membership, after the clusters are initialized or restructured"""
+
+        self.nclusters = membership[0].shape[0]
+
+        for mask, axis in zip(self.clusters, membership):
+            mask.fill(False)
+            mask[:axis.shape[0], :axis.shape[1]] = axis.cpu().numpy()
+
+    def set(self, axis, cluster, index, x):
+
+        """Sets the membership of node `index` of `axis` in `cluster`"""
+
+        self.clusters[axis][cluster, index] = x
+
+    def observation(self):
+
+        """
+        Returns the observation.
+
+        Returns
+        -------
+
+            dict
+                Values (`values`), shape (`shape`), cluster membership (`clusters`) and number of clusters
+                (`nclusters`).
+
+        """
+
+        return {'values': self.values, 'shape': self.shape, 'clusters': self.clusters, 'nclusters': self.nclusters}
@@ -1,7 +1,8 @@
 
 import gym
 from dgl import DGLHeteroGraph
-from .helper import retrive_skey
+from .helper import retrive_skey, edge_stats
+from .observations import GraphView
 import numpy as np
 import torch as th
 
@@ -20,6 +21,7 @@ class DGLHeteroGraphSpace(gym.spaces.Box):
             settings=None,
             np_random=None,
             clust_init='zeros',
+            validation='full',
             *args, **kwargs
 
     ):
@@ -54,6 +56,9 @@ class DGLHeteroGraphSpace(gym.spaces.Box):
                 Parameters `silence`, `in_memory` and `seed` should not be set, and will be overwritten.
         np_random: numpy random object
             Random object.
+        validation: {'full', 'structure'}, default 'full'
+            Checks performed by `contains`. 'structure' only validates the shape and cluster initialization of a graph,
+            while 'full' also validates its edge weights against the settings.
         """
 
         if np_random is None:
@@ -72,8 +77,10 @@ class DGLHeteroGraphSpace(gym.spaces.Box):
         self.n = n
         self.clusters = clusters
         self.settings = settings
-        self._np_random = np_random
         self.clust_init = clust_init
+        self.validation = validation
+
+        self._parse_settings()
 
         super(DGLHeteroGraphSpace, self).__init__(
             low=np.array(shape[0]),
@@ -81,6 +88,9 @@ class DGLHeteroGraphSpace(gym.spaces.Box):
             *args, **kwargs
         )
 
+        # set after initializing the parent, as gym spaces reset their random object
+        self._np_random = np_random
+
     def _sample(self, low, high, discrete=True) -> int:
 
         """
@@ -102,6 +112,37 @@ class DGLHeteroGraphSpace(gym.spaces.Box):
         except ValueError:
             return low
 
+    def _parse_settings(self):
+
+        """Precomputes the settings used to validate edge weights"""
+
+        self._numeric = 'NUMERIC' in retrive_skey('dstype', self.settings, 'NUMERIC')
+
+        self._minval = retrive_skey('minval', self.settings, -10.0)
+        self._maxval = retrive_skey('maxval', self.settings, 10.0)
+        self._realval = retrive_skey('realval', self.settings, True)
+
+        symbols = [alphabet for alphabet in retrive_skey('symbols', self.settings) if alphabet is not None]
+
+        if not symbols:
+            symbols = [[i for i in range(nsymbols)] for nsymbols in retrive_skey('nsymbols', self.settings, 10)]
+
+        # edge weights are numeric, so non numeric symbols can never be matched
+        self._symbols = [
+            th.tensor([float(symbol) for symbol in alphabet if self._isnumber(symbol)], dtype=th.float32)
+            for alphabet in symbols
+        ]
+
+    @staticmethod
+    def _isnumber(x):
+
+        try:
+            float(x)
+            return True
+
+        except (TypeError, ValueError):
+            return False
+
     def _node_labels(self, labels):
 
         """Returns node labels"""
@@ -135,12 +176,17 @@ class DGLHeteroGraphSpace(gym.spaces.Box):
         nclusters = self._sample(*self.clusters)
 
         # Get Settings
-        settings = {'seed': self.np_random.randint(low=1, high=10 ** 9, dtype=np.int32)}
+        seed = self.np_random.randint(low=1, high=10 ** 9, dtype=np.int32)
+        settings = {}
 
         ## Fixed
         for key, value in self.settings['fixed'].items():
             settings[key] = value
 
+        # the enforced seed is None, and only stands for the sampled one
+        if settings.get('seed') is None:
+            settings['seed'] = seed
+
         ## Discrete
         for key, value in self.settings['discrete'].items():
             settings[key] = value[self._sample(0, len(value))]
@@ -151,64 +197,58 @@ class DGLHeteroGraphSpace(gym.spaces.Box):
 
         return shape, nclusters, settings, self.clust_init
 
-    def contains(self, x: DGLHeteroGraph) -> bool:
+    def _check_edges(self, x):
 
-        # Enforce CPU
-        if x.device.type != 'cpu':
-            x = x.to('cpu')
+        """Returns if the edge weights of a graph are valid given the settings"""
 
-        # Retrive shape
-        shape = np.array([x.nodes(ntype).shape[0] for ntype in self._node_labels(x.ntypes)], dtype=self.dtype)
+        # edge statistics are computed once per episode
+        if self._numeric:
+            stats = edge_stats(x)
 
-        # Check initialization
-        if x.ndata['feat']:
-            check = x.ndata['feat'][self._node_labels(x.ntypes)[0]].shape[1]
+            values = any(minval <= stats['min'] for minval in self._minval) \
+                and any(maxval >= stats['max'] for maxval in self._maxval)
 
-        else:
-            check = len(x.nodes[self._node_labels(x.ntypes)[0]].data)
+            return values and any(stats['isreal'] == value for value in self._realval)
 
-        if self.n:
-            init = check == self.n
-        else:
-            init = check > 0
-
-        # Verify settings
-        if isinstance(x.edata['w'], dict):
-            edata = x.edata['w'].copy()
-            edata = th.cat([edata[edge] for edge in edata.keys()])
+        stats = edge_stats(x, unique=True)
 
-        else:
-            edata = x.edata['w']
+        return any(
+            th.isin(stats['unique'], symbols.to(stats['unique'].device)).all().item() for symbols in self._symbols
+        )
 
-        if 'NUMERIC' in retrive_skey('dstype', self.settings, 'NUMERIC'):
+    def contains(self, x: DGLHeteroGraph) -> bool:
 
-            values = np.array(
-                [minval <= edata.min().item() for minval in retrive_skey('minval', self.settings, -10.0)]
-            ).any() \
-                     and np.array(
-                [maxval >= edata.max().item() for maxval in retrive_skey('maxval', self.settings, 10.0)]
-            ).any()
+        # views are checked on the episode graph, without building their own
+        view = isinstance(x, GraphView)
+        graph = x.base if view else x
 
-            realval = np.array(
-                [realval == edata.isreal().all().item() for realval in retrive_skey('realval', self.settings, True)]
-            ).any()
+        if not isinstance(graph, DGLHeteroGraph):
+            return False
 
-            settings = realval and values
+        # Retrive shape
+        ntypes = self._node_labels(graph.ntypes)
+        shape = np.array([graph.num_nodes(ntype) for ntype in ntypes], dtype=self.dtype)
 
-        else:
-            symbols = retrive_skey('symbols', self.settings)
+        # Check initialization
+        if view:
+            check = x.nclusters
 
-            if symbols is None:
-                symbols = [[i for i in range(nsymbols)] for nsymbols in retrive_skey('nsymbols', self.settings, 10)]
+        elif graph.ndata['feat']:
+            check = graph.ndata['feat'][ntypes[0]].shape[1]
 
-            settings = np.array([edata.apply_(lambda y: y in s).bool().all().item() for s in symbols]).any()
+        else:
+            check = len(graph.nodes[ntypes[0]].data)
 
-        return (
-            isinstance(x, DGLHeteroGraph)
-            and super(DGLHeteroGraphSpace, self).contains(shape)
-            and init
-            and settings
-        )
+        if self.n:
+            init = check == self.n
+        else:
+            init = check > 0
 
+        if not (super(DGLHeteroGraphSpace, self).contains(shape) and init):
+            return False
 
+        if self.validation == 'structure':
+            return True
 
+        # Verify settings
+        return self._check_edges(graph)
@@ -0,0 +1,202 @@
+import warnings
+
+import dgl
+import numpy as np
+import torch as th
+
+
+def cell_nodes(graph):
+
+    """
+    Returns the nodes of every element (cell) of an n-partite graph, where the nth edge of every etype connects the
+    nodes of the same element.
+
+    Parameters
+    ----------
+
+    graph: heterograph object
+        Bipartite or tripartite dgl graph.
+
+    Returns
+    -------
+
+        list[tensor]
+            Node of every element in every ntype, ordered as ['row', 'col'(, 'ctx')].
+
+    """
+
+    rows, cols = graph.edges(etype=('row', 'elem', 'col'))
+    nodes = [rows.long(), cols.long()]
+
+    if 'ctx' in graph.ntypes:
+        nodes.append(graph.edges(etype=('row', 'elem', 'ctx'))[1].long())
+
+    return nodes
+
+
+def _top_ranks(groups, values, k):
+
+    """Returns which elements are among the `k` highest values of their group"""
+
+    # sort by value, then (stably) by group, so that every group is sorted by decreasing value
+    order = th.argsort(values, descending=True, stable=True)
+    order = order[th.argsort(groups[order], stable=True)]
+
+    counts = th.bincount(groups, minlength=int(groups.max()) + 1 if len(groups) else 0)
+    starts = th.cumsum(counts, 0) - counts
+    ranks = th.arange(len(order), device=order.device) - starts[groups[order]]
+
+    keep = th.zeros(len(order), dtype=th.bool, device=order.device)
+    keep[order[ranks < k]] = True
+
+    return keep
+
+
+class TopK:
+
+    """
+    Keeps the `k` edges of every node with the largest absolute weight. An element is kept for every etype if it is
+    among the top `k` of any of its nodes.
+    """
+
+    def __init__(self, k):
+
+        """
+        Parameters
+        ----------
+
+        k: int
+            Number of edges kept per node.
+
+        """
+
+        if k < 1:
+            raise AttributeError('k must be at least 1')
+
+        self.k = int(k)
+
+    def __call__(self, graph, np_random=None):
+
+        values = graph.edges[('row', 'elem', 'col')].data['w'].abs()
+        keep = th.zeros(len(values), dtype=th.bool, device=values.device)
+
+        for nodes in cell_nodes(graph):
+            keep |= _top_ranks(nodes, values, self.k)
+
+        return keep
+
+
+class DropValues:
+
+    """
+    Drops the edges whose weight is one of the given values, e.g. the background symbol of a symbolic dataset.
+    """
+
+    def __init__(self, values):
+
+        """
+        Parameters
+        ----------
+
+        values: list[float]
+            Weights to drop.
+
+        """
+
+        self.values = [float(value) for value in values]
+
+    def __call__(self, graph, np_random=None):
+
+        weights = graph.edges[('row', 'elem', 'col')].data['w']
+
+        return ~th.isin(weights, th.tensor(self.values, dtype=weights.dtype, device=weights.device))
+
+
+class Sample:
+
+    """
+    Keeps a fixed number of edges, sampled uniformly without replacement.
+    """
+
+    def __init__(self, n):
+
+        """
+        Parameters
+        ----------
+
+        n: int
+            Number of edges kept (all of them if there are fewer).
+
+        """
+
+        if n < 1:
+            raise AttributeError('n must be at least 1')
+
+        self.n = int(n)
+
+    def __call__(self, graph, np_random=None):
+
+        if np_random is None:
+            np_random = np.random.RandomState()
+
+        nedges = graph.num_edges(('row', 'elem', 'col'))
+
+        keep = th.zeros(nedges, dtype=th.bool)
+        keep[th.from_numpy(np_random.choice(nedges, size=min(self.n, nedges), replace=False))] = True
+
+        return keep.to(graph.device)
+
+
+def sparsify(graph, policy, np_random=None):
+
+    """
+    Returns a graph with only the elements (edges) kept by a sparsification policy, with every node and its data.
+    The edge order is kept, and every etype shares the same weights tensor.
+
+    Parameters
+    ----------
+
+    graph: heterograph object
+        Bipartite or tripartite dgl graph, where the nth edge of every etype connects the nodes of the same element.
+    policy: callable
+        Function taking the graph and a random object, and returning a bool mask of the elements to keep (e.g.
+        `TopK`, `DropValues` or `Sample`).
+    np_random: numpy random object, default None
+        Random object passed to the policy.
+
+    Returns
+    -------
+
+        heterograph object
+            Sparsified graph. If the policy keeps no edges (e.g. it drops every value of the episode), the graph is
+            returned unchanged, with a warning, so that a single episode does not stop training.
+
+    """
+
+    keep = th.nonzero(policy(graph, np_random)).flatten()
+
+    if not len(keep):
+        warnings.warn('The sparsification policy kept no edges, the episode graph is not sparsified', RuntimeWarning)
+
+        return graph
+
+    weights = graph.edges[('row', 'elem', 'col')].data['w'][keep]
+
+    edges = {}
+
+    for etype in graph.canonical_etypes:
+        src, dst = graph.edges(etype=etype)
+        edges[etype] = (src[keep], dst[keep])
+
+    sparse = dgl.heterograph(
+        edges, num_nodes_dict={ntype: graph.num_nodes(ntype) for ntype in graph.ntypes}, idtype=graph.idtype
+    ).to(graph.device)
+
+    for etype in sparse.canonical_etypes:
+        sparse.edges[etype].data['w'] = weights
+
+    for ntype in graph.ntypes:
+        for key, value in graph.nodes[ntype].data.items():
+            sparse.nodes[ntype].data[key] = value
+
+    return sparse
@@ -1,14 +1,25 @@
 
-import nclustgen
+import copy
+import weakref
+
 import numpy as np
 from dgl.dataloading import GraphDataLoader
 from torch.utils.data import SubsetRandomSampler
 
-from .helper import loader, real_to_ind, clusters_from_bool
+from .helper import loader, real_to_ind, clusters_from_membership, index_from_membership, membership_from_graph, \
+    membership_from_clusters, edge_stats, dgl_to_dense, dense_to_dgl, share_graph, resolve_device
+from .sparsify import sparsify as sparsify_graph
 import torch as th
 
 from dgl.data import DGLDataset
 
+from .bitset import PackedMembership
+from .generation import Episode
+from .timing import NULL_TIMER
+from .observations import GraphView, DenseObservation
+
+from .datasets import StreamingDataset
+
 
 class State:
 
@@ -16,7 +27,21 @@ class State:
     State class to store current environment state.
     """
 
-    def __init__(self, generator='BiclusterGenerator', n=None, np_random=None, *args, **kwargs):
+    def __init__(
+            self,
+            generator='BiclusterGenerator',
+            n=None,
+            np_random=None,
+            packed=False,
+            observation='graph',
+            max_shape=None,
+            max_clusters=None,
+            timer=None,
+            construction='nclustgen',
+            sparsify=None,
+            device=None,
+            *args, **kwargs
+    ):
 
         """
         Parameters
@@ -28,6 +53,35 @@ class State:
             The number of clusters to find.
         np_random: pointer, default None
             Random State.
+        packed: bool, default False
+            If True the clusters are kept as packed bits (see `utils.bitset`), and only written to the graph's node
+            data when an observation is emitted (`state`).
+        observation: {'graph', 'view', 'dense'}, default 'graph'
+            Observation type. 'graph' observes the current graph, which keeps changing with the state, 'view'
+            observes a `GraphView` snapshot, sharing the episode's structure and edge weights, and 'dense' observes
+            the values and cluster membership as arrays (see `DenseObservation`), updated in place.
+        max_shape: list[int], default None
+            Maximum number of nodes of every ntype, used to preallocate dense observations. If None they are sized
+            after the episodes.
+        max_clusters: int, default None
+            Maximum number of found clusters, only used if `n` is None (splitting is masked once reached). If None
+            there is no limit.
+        timer: PhaseTimer, default None
+            Timer recording the observation, generation and to_graph phases (see `utils.timing`). If None nothing is
+            recorded.
+        construction: {'nclustgen', 'dense'}, default 'nclustgen'
+            How `reset` builds the graph. 'nclustgen' uses the generator's `to_graph`, while 'dense' builds the same
+            graph from the generated array with `dense_to_dgl`, which scales to large shapes. The array is then kept
+            as float32, sharing memory with the edge weights, and the generator is released.
+        sparsify: callable, default None
+            Policy selecting the edges kept in the observed graph, applied once per episode (e.g. `TopK`, `DropValues`
+            or `Sample` from `utils.sparsify`), recorded as the `sparsify` phase. Every node is kept, so the hidden
+            clusters, and the reward, are not affected. If None the graph is not sparsified.
+        device: str or torch device, default None
+            Device of the graphs, cluster tensors and metric computation (e.g. 'cpu' or 'cuda:0', where 'cuda' is the
+            current cuda device). Graphs are built on it when the generator supports it, and moved to it otherwise,
+            so that on 'cpu' there is no device probing or transfer. If None graphs are built on the gpu if one is
+            available (nclustgen's fallback), and episodes built elsewhere are not moved.
 
         Attributes
         ----------
@@ -44,12 +98,31 @@ class State:
         if np_random is None:
             np_random = np.random.RandomState()
 
+        # nclustgen starts a JVM on import, so it is only imported once a state is built
+        import nclustgen
+
         self._cls = loader(generator, nclustgen)
         self.n = n
         self.defined = n is not None
 
         self._generator = None
         self._ntypes = None
+        self._hmembership = None
+        self._counts = None
+        self._nnodes = None
+        self._packed_mode = packed
+        self._observation_type = observation
+        self._max_shape = max_shape
+        self._max_clusters = max_clusters
+        self._dense = None
+        self._dense_values = False
+        self._timer = NULL_TIMER if timer is None else timer
+        self._construction = construction
+        self._sparsify = sparsify
+        self._device = resolve_device(device)
+        self._packed = None
+        self._dirty = set()
+        self._edits = []
         self._np_random = np_random
 
         self.cluster_coverage = None
@@ -83,7 +156,61 @@ class State:
 
         """
 
-        return clusters_from_bool(self.current, self._ntypes)
+        return clusters_from_membership(self.membership)
+
+    @property
+    def cluster_index(self):
+
+        """
+        Returns the current found clusters as index tensors, without building python lists.
+
+        Returns
+        -------
+
+            list[list[tensor]]
+                Found clusters indexes, one tensor per cluster and ntype.
+
+        """
+
+        return index_from_membership(self.membership)
+
+    @property
+    def membership(self):
+
+        """
+        Returns the current found clusters as bool tensors, one per ntype.
+
+        Returns
+        -------
+
+            list[tensor]
+                Cluster membership, **Shape**: (nclusters, nnodes) per ntype.
+
+        """
+
+        if self._packed is not None:
+            return [mask.to(self.current.device) for mask in self._packed.tensors()]
+
+        return membership_from_graph(self.current, self._ntypes)
+
+    @property
+    def nclusters(self):
+
+        """
+        Returns the current number of found clusters.
+
+        Returns
+        -------
+
+            int
+                Number of found clusters.
+
+        """
+
+        if self._packed is not None:
+            return self._packed.nclusters
+
+        return len(self.current.nodes[self._ntypes[0]].data)
 
     @property
     def hclusters(self):
@@ -100,6 +227,57 @@ class State:
 
         return self._generator.Y
 
+    @property
+    def hmembership(self):
+        """
+        Returns hidden clusters as bool tensors, one per ntype (encoded once per episode).
+
+        Returns
+        -------
+
+            list[tensor]
+                Hidden cluster membership, **Shape**: (nhclusters, nnodes) per ntype.
+
+        """
+
+        return self._hmembership
+
+    @property
+    def member_counts(self):
+        """
+        Returns the number of members of every found cluster in every ntype, kept up to date by the actions.
+
+        Returns
+        -------
+
+            numpy array
+                Member counts, **Shape**: (ntypes, nclusters).
+
+        """
+
+        if self._counts is None:
+            if self._packed is not None:
+                self._counts = self._packed.counts()
+            else:
+                self._counts = np.stack([mask.sum(1).cpu().numpy() for mask in self.membership]).astype(np.int64)
+
+        return self._counts
+
+    @property
+    def edge_stats(self):
+        """
+        Returns the statistics of the current edge weights (computed once per episode).
+
+        Returns
+        -------
+
+            dict
+                Minimum (`min`), maximum (`max`) and if all weights are real (`isreal`).
+
+        """
+
+        return edge_stats(self.current)
+
     @property
     def hclusters_size(self):
         """
@@ -191,37 +369,44 @@ class State:
 
         """
 
-        nclusters = len(self.clusters)
+        with self._timer.phase('observation'):
+            counts = self.member_counts
+            nclusters = counts.shape[1]
 
-        # Check if add and remove actions are available
-        add = np.full((len(self._ntypes), nclusters), True, dtype=bool)
-        remove = np.full((len(self._ntypes), nclusters), True, dtype=bool)
+            # Check if add and remove actions are available, a node can be added to a cluster that does not hold every
+            # node of an ntype, and removed from a cluster that holds any
+            add = bool((counts < self._nnodes[:, None]).any())
+            remove = bool((counts > 0).any())
 
-        for i, ntype in enumerate(self._ntypes):
-            for j in self.current.nodes[ntype].data:
+            if self.defined:
+                mask = np.array([add, remove, False, False]).astype(int)
 
-                cluster = self.current.nodes[ntype].data[j]
+            else:
+                merge = nclusters > 1
+                split = self._max_clusters is None or nclusters < self._max_clusters
+                mask = np.array([add, remove, merge, split]).astype(int)
 
-                if cluster.all():
-                    add[i][j] = False
-                elif not cluster.any():
-                    remove[i][j] = False
+            return {
+                "action_mask": mask.astype(np.float32),
+                "avail_actions": np.ones(len(mask), dtype=np.float32),
+                "state": self._observation()
+            }
 
-        add = add.any()
-        remove = remove.any()
+    def _observation(self):
 
-        if self.defined:
-            mask = np.array([add, remove, False, False]).astype(int)
+        """
+        Returns the observation of the current graph, given the observation type.
+        """
 
-        else:
-            merge = nclusters > 1
-            mask = np.array([add, remove, merge, True]).astype(int)
+        if self._observation_type == 'view':
+            return GraphView(self.current, self._ntypes, self.membership)
 
-        return {
-            "action_mask": mask.astype(np.float32),
-            "avail_actions": np.ones(len(mask), dtype=np.float32),
-            "state": self.current
-        }
+        if self._observation_type == 'dense':
+            return self._dense.observation()
+
+        self._sync()
+
+        return self.current
 
     @property
     def as_dense(self):
@@ -273,13 +458,280 @@ class State:
 
         if isinstance(x, bool):
             # parse param(ntype) into string
-            ntype = self._ntypes[real_to_ind(self._ntypes, params[0])]
+            axis = real_to_ind(self._ntypes, params[0])
+            ntype = self._ntypes[axis]
             # parse param(node) into index
-            index = real_to_ind(self.current.nodes(ntype), params[1])
+            index = real_to_ind(range(self._nnodes[axis]), params[1])
             # parse param(cluster) into index
-            cluster = real_to_ind(self.current.nodes[ntype].data, params[2])
-            # set value on node data
-            self.current.nodes[ntype].data[cluster][index] = x
+            cluster = real_to_ind(range(self.nclusters), params[2])
+
+            if self._packed is not None:
+                changed = self._packed.get(axis, cluster, index) != x
+
+                if changed:
+                    self._packed.set(axis, cluster, index, x)
+
+                    if self._dirty is not True:
+                        self._dirty.add(cluster)
+
+            else:
+                data = self.current.nodes[ntype].data[cluster]
+                changed = bool(data[index]) != x
+
+                if changed:
+                    # set value on node data
+                    data[index] = x
+
+            if changed:
+                self._log_edit(axis, cluster, index, x)
+
+                if self._dense is not None:
+                    self._dense.set(axis, cluster, index, x)
+
+                if self._counts is not None:
+                    self._counts[axis, cluster] += 1 if x else -1
+
+    def set_nodes(self, x, cluster, nodes):
+
+        """
+        Sets the cluster value for several nodes of every ntype, with one vectorized assignment per ntype.
+
+        Parameters
+        ----------
+
+        x: bool
+            Value to set.
+        cluster: int
+            Index of the cluster.
+        nodes: list
+            Nodes of every ntype, as a bool mask, an index array, a slice or range, or None to leave it unchanged.
+
+        """
+
+        for axis, ntype in enumerate(self._ntypes):
+
+            if nodes[axis] is None:
+                continue
+
+            index = self._node_index(axis, nodes[axis])
+
+            if self._packed is not None:
+                changed = self._packed.set_many(axis, cluster, index, x)
+
+                if len(changed) and self._dirty is not True:
+                    self._dirty.add(cluster)
+
+            else:
+                data = self.current.nodes[ntype].data[cluster]
+                index_ = th.from_numpy(index).to(data.device)
+
+                changed = index[(data[index_] != x).cpu().numpy()]
+                data[index_] = x
+
+            if len(changed):
+                self._log_edit(axis, cluster, changed, x)
+
+                if self._counts is not None:
+                    self._counts[axis, cluster] += len(changed) if x else -len(changed)
+
+                if self._dense is not None:
+                    self._dense.set(axis, cluster, changed, x)
+
+    def _node_index(self, axis, nodes):
+
+        """Returns the sorted, distinct index of the given nodes of an ntype"""
+
+        if isinstance(nodes, (slice, range)):
+            return np.arange(self._nnodes[axis])[nodes]
+
+        if isinstance(nodes, th.Tensor):
+            nodes = nodes.cpu().numpy()
+
+        nodes = np.asarray(nodes)
+
+        if nodes.dtype == bool:
+            return np.flatnonzero(nodes)
+
+        return np.unique(nodes.astype(np.int64))
+
+    def _log_edit(self, axis, cluster, index, x):
+
+        """
+        Records a membership edit, so that incremental consumers can be updated without rescanning the clusters.
+
+        Parameters
+        ----------
+
+        axis: int
+            Index of the edited ntype.
+        cluster: int
+            Index of the edited cluster.
+        index: int or numpy array
+            Index of the edited node(s), every one of them must have changed value.
+        x: bool
+            Value set.
+
+        """
+
+        if self._edits is not None:
+            self._edits.append((axis, cluster, index, x))
+
+    def pop_edits(self):
+
+        """
+        Returns the membership edits applied since the last call, and clears them.
+
+        Returns
+        -------
+
+            list or None
+                List of (axis, cluster, index, value) edits, or None if the clusters were restructured (merged or
+                split) and must be read again.
+
+        """
+
+        edits = self._edits
+        self._edits = []
+
+        return edits
+
+    def snapshot(self):
+
+        """
+        Returns the mutable part of the state, the cluster membership, member counts, pending edits and random state.
+        The episode data is not copied.
+
+        Returns
+        -------
+
+            dict
+                Snapshot token, to be passed to `restore`.
+
+        """
+
+        if self._packed is not None:
+            membership = [words.copy() for words in self._packed.words]
+        else:
+            # stacking the node data already copies it
+            membership = membership_from_graph(self.current, self._ntypes)
+
+        return {
+            'episode': weakref.ref(self.current),
+            'membership': membership,
+            'counts': None if self._counts is None else self._counts.copy(),
+            'edits': None if self._edits is None else list(self._edits),
+            'random': self._np_random.get_state(),
+        }
+
+    def clone(self, np_random=None, timer=None):
+
+        """
+        Returns a state in the current episode that is updated independently. The clone shares the episode's graph
+        structure, edge weights and hidden clusters (moved to shared memory, unless the weights are a view of the
+        episode's array), and only owns its cluster membership. This state is not modified.
+
+        Parameters
+        ----------
+
+        np_random: numpy random object, default None
+            Random object of the clone, if None it starts as a copy of this state's random object.
+        timer: PhaseTimer, default None
+            Timer of the clone, if None nothing is recorded.
+
+        Returns
+        -------
+
+            State
+                Cloned state.
+
+        """
+
+        if np_random is None:
+            np_random = np.random.RandomState()
+            np_random.set_state(self._np_random.get_state())
+
+        for mask in self._hmembership:
+            mask.share_memory_()
+
+        membership = self.membership
+
+        # moving the edge weights to shared memory copies them, so weights that are a view of the array are kept
+        weights = self.current.edges[('row', 'elem', 'col')].data['w']
+        x = getattr(self._generator, 'X', None)
+        view = isinstance(x, np.ndarray) and x.size > 0 and weights.data_ptr() == x.ctypes.data
+
+        graph = share_graph(self.current, share_memory=not view)
+
+        for axis, ntype in enumerate(self._ntypes):
+            for j in range(len(membership[axis])):
+                graph.nodes[ntype].data[j] = membership[axis][j].clone()
+
+        state = copy.copy(self)
+        state._set_current(graph)
+
+        state._np_random = np_random
+        state._timer = NULL_TIMER if timer is None else timer
+        state._counts = None if self._counts is None else self._counts.copy()
+        state._edits = None if self._edits is None else list(self._edits)
+        state._packed = None if self._packed is None else self._packed.copy()
+        state._dirty = set()
+
+        state._dense = None
+        state._dense_values = True
+        state._load_dense()
+
+        return state
+
+    def _set_current(self, graph):
+
+        """
+        Replaces the current graph by a graph of the same episode, keeping the episode data in a container that does not
+        hold the generator.
+        """
+
+        self._generator = Episode(self._generator.X, self.hclusters, graph, self.coverage)
+
+    def restore(self, token):
+
+        """
+        Restores a snapshot taken in the current episode, the same snapshot can be restored any number of times.
+
+        Parameters
+        ----------
+
+        token: dict
+            Snapshot token, as returned by `snapshot`.
+
+        """
+
+        if token['episode']() is not self.current:
+            raise AttributeError('Snapshot was not taken in the current episode')
+
+        membership = token['membership']
+
+        if self._packed is not None:
+            self._packed.words = [words.copy() for words in membership]
+            self._dirty = True
+
+        elif len(membership[0]) == self.nclusters:
+            # node data tensors are updated in place
+            for axis, ntype in enumerate(self._ntypes):
+                for j in range(len(membership[axis])):
+                    self.current.nodes[ntype].data[j].copy_(membership[axis][j])
+
+        else:
+            for key in list(self.current.nodes[self._ntypes[0]].data.keys()):
+                self.current.ndata.pop(key)
+
+            for axis, ntype in enumerate(self._ntypes):
+                for j in range(len(membership[axis])):
+                    self.current.nodes[ntype].data[j] = membership[axis][j].clone()
+
+        self._counts = None if token['counts'] is None else token['counts'].copy()
+        self._edits = None if token['edits'] is None else list(token['edits'])
+        self._np_random.set_state(token['random'])
+
+        self._load_dense()
 
     def _reset_clusters_index(self):
         """
@@ -290,6 +742,98 @@ class State:
         for i, key in enumerate(keys):
             self.current.ndata[i] = self.current.ndata.pop(key)
 
+    def _load_clusters(self):
+
+        """
+        Reads the clusters after they are initialized, resetting the member counts and packing them if required.
+        """
+
+        self._counts = None
+
+        if self._packed_mode:
+            self._packed = PackedMembership(membership_from_graph(self.current, self._ntypes))
+            self._dirty = set()
+
+        self._load_dense()
+
+    def _load_dense(self):
+
+        """
+        Writes the clusters, and the values of a new episode, to the dense observation, (re)allocating it if the
+        episode does not fit.
+        """
+
+        if self._observation_type != 'dense':
+            return
+
+        nclusters = self.nclusters
+
+        if self._dense is None or not self._dense.fits(self._nnodes, nclusters):
+            shape = self._nnodes if self._max_shape is None else np.maximum(self._max_shape, self._nnodes)
+            max_clusters = max(self.n or self._max_clusters or nclusters, nclusters)
+
+            self._dense = DenseObservation(list(shape), max_clusters)
+            self._dense_values = True
+
+        if self._dense_values:
+            x = self.as_dense
+
+            # ctx is the first axis of tridimensional data, and the last ntype
+            if len(self._ntypes) == 3:
+                x = np.moveaxis(x, 0, -1)
+
+            self._dense.load_values(x)
+            self._dense_values = False
+
+        self._dense.load_clusters(self.membership)
+
+    def _sync(self):
+
+        """
+        Writes the packed clusters to the graph's node data, if they changed since the last call.
+        """
+
+        if self._packed is None or not self._dirty:
+            return
+
+        if self._dirty is True:
+            membership = self.membership
+
+            for key in list(self.current.nodes[self._ntypes[0]].data.keys()):
+                self.current.ndata.pop(key)
+
+            for axis, ntype in enumerate(self._ntypes):
+                for j in range(self._packed.nclusters):
+                    self.current.nodes[ntype].data[j] = membership[axis][j]
+
+        else:
+            # node data tensors are updated in place
+            for axis, ntype in enumerate(self._ntypes):
+                for j in self._dirty:
+                    self.current.nodes[ntype].data[j].copy_(self._packed.row(axis, j))
+
+        self._dirty = set()
+
+    def _restructure_counts(self, removed, added):
+
+        """
+        Updates the member counts after clusters are restructured, following the order of `_reset_clusters_index`.
+
+        Parameters
+        ----------
+
+        removed: list[int]
+            Index of the removed clusters.
+        added: list[list[int]]
+            Member counts of every new cluster (appended after the remaining ones), by ntype.
+
+        """
+
+        if self._counts is not None:
+            self._counts = np.concatenate(
+                (np.delete(self._counts, removed, axis=1), np.array(added, dtype=np.int64).T), axis=1
+            )
+
     def add(self, params):
 
         """
@@ -320,6 +864,63 @@ class State:
 
         self._set_node(False, params[:3])
 
+    def _set_range(self, x, params):
+
+        """
+        Sets the cluster value for a range of nodes of every ntype.
+
+        Parameters
+        ----------
+
+        x: bool
+            value to set
+        params: list[float]
+            List of parameters, [cluster, start, stop] followed by the start and stop of the remaining ntypes,
+            range: [0, 1]. The ends of a range can be given in any order, and equal ends select no nodes.
+
+        """
+
+        cluster = real_to_ind(range(self.nclusters), params[0])
+        nodes = []
+
+        for axis, nnodes in enumerate(self._nnodes):
+            ends = [real_to_ind(range(nnodes + 1), param) for param in params[1 + 2 * axis:3 + 2 * axis]]
+            nodes.append(slice(min(ends), max(ends)))
+
+        self.set_nodes(x, cluster, nodes)
+
+    def add_range(self, params):
+
+        """
+        Adds a range of nodes of every ntype to the cluster.
+
+        Parameters
+        ----------
+
+        params: list[float]
+            List of parameters, [cluster, start, stop] followed by the start and stop of the remaining ntypes,
+            range: [0, 1]
+
+        """
+
+        self._set_range(True, params)
+
+    def remove_range(self, params):
+
+        """
+        Removes a range of nodes of every ntype from the cluster.
+
+        Parameters
+        ----------
+
+        params: list[float]
+            List of parameters, [cluster, start, stop] followed by the start and stop of the remaining ntypes,
+            range: [0, 1]
+
+        """
+
+        self._set_range(False, params)
+
     def merge(self, params):
 
         """
@@ -338,24 +939,39 @@ class State:
         if not self.defined:
 
             # get index to set
-            index = len(self.clusters)
+            index = self.nclusters
 
             # parse params(clusters) into index
-            cluster1, cluster2 = [real_to_ind(self.clusters, param) for param in params]
+            cluster1, cluster2 = [real_to_ind(range(index), param) for param in params]
+
+            if cluster1 != cluster2 and self._packed is not None:
+                counts = self._packed.merge(cluster1, cluster2)
+
+                self._dirty = True
+                self._edits = None
+                self._restructure_counts([cluster1, cluster2], counts)
+                self._load_dense()
 
             # Set new cluster
-            if cluster1 != cluster2:
+            elif cluster1 != cluster2:
+                counts = []
+
                 for ntype in self._ntypes:
                     self.current.nodes[ntype].data[index] = th.bitwise_or(
                         self.current.nodes[ntype].data[cluster1], self.current.nodes[ntype].data[cluster2]
                     )
+                    counts.append(int(self.current.nodes[ntype].data[index].sum()))
 
                 # Delete previous clusters
                 self.current.ndata.pop(cluster1)
                 self.current.ndata.pop(cluster2)
 
+                self._edits = None
+                self._restructure_counts([cluster1, cluster2], [counts])
+
                 # reset index
                 self._reset_clusters_index()
+                self._load_dense()
 
     def split(self, params):
 
@@ -372,50 +988,98 @@ class State:
 
         params = params[:1]
 
-        if not self.defined:
+        if not self.defined and (self._max_clusters is None or self.nclusters < self._max_clusters):
 
             # get indexes to set
-            index1 = len(self.clusters)
+            index1 = self.nclusters
             index2 = index1 + 1
 
             # parse param(cluster) into index
-            cluster = real_to_ind(self.clusters, params[0])
+            cluster = real_to_ind(range(self.nclusters), params[0])
 
-            for ntype in self._ntypes:
+            if self._packed is not None:
+                # select partition points
+                points = [self._np_random.randint(low=0, high=nnodes, dtype=np.int32) for nnodes in self._nnodes]
 
-                # select partition point
-                index = self._np_random.randint(
-                    low=0, high=len(self.current.nodes[ntype].data[cluster]), dtype=np.int32
-                )
+                self._dirty = True
+                self._edits = None
+                self._restructure_counts([cluster], self._packed.split(cluster, points))
+                self._load_dense()
 
-                # create new clusters
-                self.current.nodes[ntype].data[index1] = th.cat((
-                    self.current.nodes[ntype].data[cluster][:index],
-                    th.zeros(len(self.current.nodes[ntype].data[cluster][index:]), dtype=th.bool)),
-                    0
-                )
+            else:
+                counts = [[], []]
 
-                self.current.nodes[ntype].data[index2] = th.cat((
-                    th.zeros(len(self.current.nodes[ntype].data[cluster][:index]), dtype=th.bool),
-                    self.current.nodes[ntype].data[cluster][index:]),
-                    0
-                )
+                for ntype in self._ntypes:
+
+                    # select partition point
+                    index = self._np_random.randint(
+                        low=0, high=len(self.current.nodes[ntype].data[cluster]), dtype=np.int32
+                    )
 
-            # delete previous cluster
-            self.current.ndata.pop(cluster)
+                    device = self.current.nodes[ntype].data[cluster].device
 
-            # reset index
-            self._reset_clusters_index()
+                    # create new clusters
+                    self.current.nodes[ntype].data[index1] = th.cat((
+                        self.current.nodes[ntype].data[cluster][:index],
+                        th.zeros(len(self.current.nodes[ntype].data[cluster][index:]), dtype=th.bool, device=device)),
+                        0
+                    )
+
+                    self.current.nodes[ntype].data[index2] = th.cat((
+                        th.zeros(len(self.current.nodes[ntype].data[cluster][:index]), dtype=th.bool, device=device),
+                        self.current.nodes[ntype].data[cluster][index:]),
+                        0
+                    )
+
+                    counts[0].append(int(self.current.nodes[ntype].data[index1].sum()))
+                    counts[1].append(int(self.current.nodes[ntype].data[index2].sum()))
+
+                # delete previous cluster
+                self.current.ndata.pop(cluster)
+
+                self._edits = None
+                self._restructure_counts([cluster], counts)
+
+                # reset index
+                self._reset_clusters_index()
+                self._load_dense()
 
     def _reset(self):
 
+        self._edits = []
+
+        # episodes that were not built on the device (loaded, pooled or dense) are moved once
+        if self._device is not None and self.current.device != self._device:
+            self._set_current(self.current.to(self._device))
+
         # update ntype
         self._ntypes = [ntypes for ntypes in self.current.ntypes]
         self._ntypes.insert(0, self._ntypes.pop())
 
+        self._nnodes = np.array([self.current.num_nodes(ntype) for ntype in self._ntypes], dtype=np.int64)
+
+        # the values of dense observations are written once per episode
+        self._dense_values = True
+
+        # member counts are read again from the new clusters
+        self._load_clusters()
+
         # update cluster coverage
         self.cluster_coverage = self._set_cluster_coverage()
 
+        # encode hidden clusters
+        self._hmembership = membership_from_clusters(
+            self.hclusters, [self.current.num_nodes(ntype) for ntype in self._ntypes], device=self.current.device
+        )
+
+        # sparsified after the dense values are written, so that they hold the full data
+        if self._sparsify is not None:
+            with self._timer.phase('sparsify'):
+                self._set_current(sparsify_graph(self.current, self._sparsify, self._np_random))
+
+        # edge weights are fixed for the episode, so their statistics are only computed once
+        edge_stats(self.current)
+
     def reset(self, shape, nclusters, settings=None, clust_init='zeros', **kwargs):
 
         """
@@ -448,17 +1112,98 @@ class State:
             settings = {}
 
         # generate
-        self._generator = self._cls(**settings)
-        self._generator.generate(*shape, nclusters=nclusters)
+        with self._timer.phase('generation'):
+            self._generator = self._cls(**settings)
+            self._generator.generate(*shape, nclusters=nclusters)
+
+        if self._construction == 'dense':
+            with self._timer.phase('to_graph'):
+                # the edge weights are a view of the float32 array
+                x = np.ascontiguousarray(self._generator.X, dtype=np.float32)
+                episode = Episode(x, self._generator.Y, dense_to_dgl(x), self._generator.coverage, settings.get('seed'))
+
+            if kwargs.get('not_init'):
+                self._generator = episode
+                self._reset()
+
+                return self.state
+
+            return self.reset_from(episode, clust_init=clust_init)
+
+        # nclustgen only probes for a gpu (falling back to the cpu) if asked for one
+        if self._device is None:
+            device = {'device': 'gpu'}
+        elif self._device.type == 'cpu':
+            device = {'device': 'cpu'}
+        else:
+            device = {'device': 'gpu', 'cuda': self._device.index}
+
+        with self._timer.phase('to_graph'):
+            if kwargs.get('not_init'):
+                self._generator.to_graph(framework='dgl', nclusters=0, clust_init=clust_init, **device)
+            elif self.defined:
+                self._generator.to_graph(framework='dgl', nclusters=self.n, clust_init=clust_init, **device)
+            else:
+                self._generator.to_graph(framework='dgl', clust_init=clust_init, **device)
+
+        self._reset()
+
+        return self.state
 
-        if kwargs.get('not_init'):
-            self._generator.to_graph(framework='dgl', device='gpu', nclusters=0, clust_init=clust_init)
-        elif self.defined:
-            self._generator.to_graph(framework='dgl', device='gpu', nclusters=self.n, clust_init=clust_init)
+    def _init_clusts(self, clust_init='zeros'):
+
+        """
+        Initializes clusters on current graph
+
+        Parameters
+        ----------
+
+        clust_init: str or function, default 'zeros'
+            Function to initialize clusters. If string it should be a function available in torch. Else it should point
+            to a function with inputs in form (shape, dtype).
+
+        """
+
+        clust_init = loader(clust_init, th)
+
+        if self.defined:
+            nclusters = self.n
         else:
-            self._generator.to_graph(framework='dgl', device='gpu', clust_init=clust_init)
+            nclusters = 1
+
+        for n, axis in enumerate(self._ntypes):
+            for i in range(nclusters):
+                self.current.nodes[axis].data[i] = clust_init(
+                    self.current.num_nodes(axis), dtype=th.bool
+                ).to(self.current.device)
+
+        self._load_clusters()
+
+    def reset_from(self, episode, clust_init='zeros'):
+
+        """
+        Resets the state from an episode generated elsewhere (e.g. by an `EpisodePool`).
+
+        Parameters
+        ----------
+
+        episode: Episode
+            Generated episode, its graph should not have initialized clusters.
+        clust_init: str or function, default 'zeros'
+            Function to initialize clusters, see `_init_clusts`.
+
+        Returns
+        -------
+
+            observation (object)
+                The initial observation.
+
+        """
+
+        self._generator = episode
 
         self._reset()
+        self._init_clusts(clust_init)
 
         return self.state
 
@@ -475,16 +1220,25 @@ class OfflineState(State):
             train_test_split=0.8,
             n=None,
             np_random=None,
+            prefetch=0,
+            workers=None,
+            packed=False,
+            observation='graph',
+            max_shape=None,
+            max_clusters=None,
+            timer=None,
+            sparsify=None,
+            device=None,
             *args, **kwargs):
         """
         Parameters
         ----------
 
         dataset: class
-             DGL dataset class.
+             DGL dataset class, or StreamingDataset.
 
         train_test_split: float, default 0.8
-            The percentage for train/test split
+            The percentage for train/test split. Streaming datasets are split by shards.
 
         n: int, default None
             The number of clusters to find.
@@ -492,6 +1246,34 @@ class OfflineState(State):
         np_random: pointer, default None
             Random object. If undefined np.random will be used
 
+        prefetch: int, default 0
+            Number of examples loaded ahead of time by background processes. If 0 examples are loaded on reset.
+
+        workers: int, default None
+            Number of background processes loading examples, if None it defaults to `prefetch`.
+
+        packed: bool, default False
+            If True the clusters are kept as packed bits, see `State`.
+
+        observation: {'graph', 'view', 'dense'}, default 'graph'
+            Observation type, see `State`.
+
+        max_shape: list[int], default None
+            Maximum number of nodes of every ntype, see `State`.
+
+        max_clusters: int, default None
+            Maximum number of found clusters, see `State`.
+
+        timer: PhaseTimer, default None
+            Timer recording the phases of the state, see `State`. Loading examples is recorded as `loading`.
+
+        sparsify: callable, default None
+            Policy selecting the edges kept in the observed graph, see `State`. `as_dense` is then built from the
+            sparsified graph, with the dropped elements as zeros.
+
+        device: str or torch device, default None
+            Device of the graphs, see `State`. Loaded examples are moved to it, if None they are kept as loaded.
+
         Attributes
         ----------
 
@@ -504,29 +1286,44 @@ class OfflineState(State):
 
         """
 
-        if not isinstance(dataset, DGLDataset):
-            raise AttributeError('Dataset must inherit from DGLDataset class')
+        if not isinstance(dataset, (DGLDataset, StreamingDataset)):
+            raise AttributeError('Dataset must inherit from DGLDataset or StreamingDataset class')
 
         if 0 > train_test_split or train_test_split > 1 :
             raise AttributeError('train_test_split must be between 0 and 1')
 
         super(OfflineState, self).__init__(
             n=n,
-            np_random=np_random
+            np_random=np_random,
+            packed=packed,
+            observation=observation,
+            max_shape=max_shape,
+            max_clusters=max_clusters,
+            timer=timer,
+            sparsify=sparsify,
+            device=device
         )
 
-        num_examples = len(dataset)
-        num_train = int(num_examples * train_test_split)
+        loader_kwargs = {'batch_size': 1, 'drop_last': False}
 
-        train_sampler = SubsetRandomSampler(th.arange(num_train))
-        test_sampler = SubsetRandomSampler(th.arange(num_train, num_examples))
+        if prefetch:
+            # workers are spawned so that they do not inherit a running JVM, and are kept across epochs
+            workers = workers or int(prefetch)
+            loader_kwargs.update(
+                num_workers=workers,
+                prefetch_factor=max(int(prefetch) // workers, 1),
+                persistent_workers=True,
+                multiprocessing_context='spawn'
+            )
 
-        self._train_dataloader = GraphDataLoader(
-            dataset, sampler=train_sampler, batch_size=1, drop_last=False)
-        self._test_dataloader = GraphDataLoader(
-            dataset, sampler=test_sampler, batch_size=1, drop_last=False)
+        self._dataset = dataset
+        self._train_test_split = train_test_split
+
+        # seed of the train sampler, kept so that clones sample the same order
+        self._seed = None if isinstance(dataset, StreamingDataset) else int(self._np_random.randint(2 ** 31))
+
+        self._build_dataloaders(loader_kwargs)
 
-        self._test_iter = 0
         self.graph = None
         self.label = None
 
@@ -545,6 +1342,85 @@ class OfflineState(State):
         """
         return tuple([list(self.current.nodes(axis).shape)[0] for axis in self._ntypes])
 
+    def _build_dataloaders(self, loader_kwargs):
+
+        """
+        Builds the train and test dataloaders, with new iterators.
+
+        Parameters
+        ----------
+
+        loader_kwargs: dict
+            Parameters of the dataloaders.
+
+        """
+
+        if isinstance(self._dataset, StreamingDataset):
+            train_dataset, test_dataset = self._dataset.split(self._train_test_split)
+
+            self._train_dataloader = GraphDataLoader(train_dataset, **loader_kwargs)
+            self._test_dataloader = GraphDataLoader(test_dataset, **loader_kwargs)
+
+        else:
+            num_examples = len(self._dataset)
+            num_train = int(num_examples * self._train_test_split)
+
+            # train examples are sampled without replacement within every epoch, test examples are swept in order
+            generator = th.Generator().manual_seed(self._seed)
+            train_sampler = SubsetRandomSampler(th.arange(num_train), generator=generator)
+            test_sampler = range(num_train, num_examples)
+
+            self._train_dataloader = GraphDataLoader(self._dataset, sampler=train_sampler, **loader_kwargs)
+            self._test_dataloader = GraphDataLoader(self._dataset, sampler=test_sampler, **loader_kwargs)
+
+        # iterators live across episodes and are only renewed at the end of an epoch
+        self._iterators = {}
+        self._test_iter = 0
+
+    def clone(self, np_random=None, timer=None):
+
+        """
+        Returns a state in the current episode that is updated independently, see `State.clone`. The clone iterates
+        its own dataloaders, without background workers, so that resetting it does not advance this state's
+        iterators. Its test sweep starts over.
+
+        Parameters
+        ----------
+
+        np_random: numpy random object, default None
+            Random object of the clone, if None it starts as a copy of this state's random object.
+        timer: PhaseTimer, default None
+            Timer of the clone, if None nothing is recorded.
+
+        Returns
+        -------
+
+            OfflineState
+                Cloned state.
+
+        """
+
+        state = super(OfflineState, self).clone(np_random=np_random, timer=timer)
+        state._build_dataloaders({'batch_size': 1, 'drop_last': False})
+
+        return state
+
+    @property
+    def as_dense(self):
+
+        """
+        Returns the current state as a dense array, built from the graph.
+
+        Returns
+        -------
+
+            numpy array
+                Current state as a dense array.
+
+        """
+
+        return dgl_to_dense(self.current)
+
     @property
     def current(self):
 
@@ -577,20 +1453,18 @@ class OfflineState(State):
 
         return self.label
 
-    def _init_clusts(self):
+    def _set_current(self, graph):
+        self.graph = graph
 
-        """
-        Initializes clusters on current graph
-        """
+    def _next(self, dataloader):
 
-        if self.defined:
-            nclusters = self.n
-        else:
-            nclusters = 1
+        try:
+            return next(self._iterators[id(dataloader)])
 
-        for n, axis in enumerate(self._ntypes):
-            for i in range(nclusters):
-                self.graph.nodes[axis].data[i] = th.zeros(len(self.graph.nodes(axis)), dtype=th.bool)
+        except (KeyError, StopIteration):
+            self._iterators[id(dataloader)] = iter(dataloader)
+
+            return next(self._iterators[id(dataloader)])
 
     def reset(self, train=True, **kwargs):
 
@@ -608,23 +1482,35 @@ class OfflineState(State):
 
             observation (object)
                 The initial observation.
+            done (bool)
+                Only returned when not training, if the episode is the last one of the test split. The following
+                reset starts a new sweep over the test split.
 
         """
 
         if train:
-            self.graph, self.label = next(self._train_dataloader.__iter__())
+            with self._timer.phase('loading'):
+                self.graph, self.label = self._next(self._train_dataloader)
+
             self._reset()
             self._init_clusts()
 
             return self.state
 
         else:
-            self.graph, self.label = next(self._test_dataloader.__iter__())
+            with self._timer.phase('loading'):
+                self.graph, self.label = self._next(self._test_dataloader)
+
             self._reset()
             self._init_clusts()
             self._test_iter += 1
 
-            return self.state, self._test_iter >= len(self._test_dataloader)
+            done = self._test_iter >= len(self._test_dataloader)
+
+            if done:
+                self._test_iter = 0
+
+            return self.state, done
 
 
 
@@ -0,0 +1,112 @@
+import time
+from contextlib import nullcontext
+
+
+class _Phase:
+
+    __slots__ = ('_timer', '_name', '_start')
+
+    def __init__(self, timer, name):
+        self._timer = timer
+        self._name = name
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self._timer.record(self._name, time.perf_counter() - self._start)
+
+
+class PhaseTimer:
+
+    """
+    Records the cumulative wall time and number of calls of named phases (e.g. of an environment step).
+
+    Examples
+    --------
+    >>> timer = PhaseTimer()
+    >>> with timer.phase('metric'):
+    >>>     ...
+    >>> timer.summary()
+    """
+
+    enabled = True
+
+    def __init__(self):
+
+        """
+        Attributes
+        ----------
+
+        times: dict
+            Cumulative wall time of every phase, in seconds.
+        calls: dict
+            Number of calls of every phase.
+
+        """
+
+        self.times = {}
+        self.calls = {}
+
+    def phase(self, name):
+
+        """Returns a context manager timing a phase"""
+
+        return _Phase(self, name)
+
+    def record(self, name, elapsed):
+
+        """Records a call of a phase that took `elapsed` seconds"""
+
+        self.times[name] = self.times.get(name, 0.0) + elapsed
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def reset(self):
+
+        """Clears the recorded phases"""
+
+        self.times.clear()
+        self.calls.clear()
+
+    def summary(self):
+
+        """
+        Returns the recorded phases.
+
+        Returns
+        -------
+
+            dict
+                Cumulative wall time (`time`, in seconds) and number of calls (`calls`) of every phase.
+
+        """
+
+        return {name: {'time': self.times[name], 'calls': self.calls[name]} for name in sorted(self.times)}
+
+
+class NullTimer:
+
+    """
+    Timer that records nothing, used when timing is disabled. Its phases are a shared no-op context manager.
+    """
+
+    enabled = False
+
+    _phase = nullcontext()
+
+    def phase(self, name):
+        return self._phase
+
+    def record(self, name, elapsed):
+        pass
+
+    def reset(self):
+        pass
+
+    def summary(self):
+        return {}
+
+
+# shared by everything that is not timed
+NULL_TIMER = NullTimer()
@@ -62,6 +62,9 @@ setup(
         'Topic :: Scientific/Engineering :: Bio-Informatics',
     ],
     packages=find_packages(),
+    entry_points={
+        'console_scripts': ['nclustenv-bench=nclustenv.bench:main'],
+    },
     python_requires=">=3.7",
     keywords='biclustring triclustering environment rl gym data nclustenv',
     test_suite='tests',
@@ -3,8 +3,13 @@
 '''
 Tests to ensure environment components functionality is satisfied.
 '''
+import json
+import pickle
 import shutil
+import subprocess
+import sys
 import traceback
+import warnings
 import unittest
 import pathlib as pl
 
@@ -15,14 +20,22 @@ import os
 
 import torch as th
 import dgl
+from dgl.dataloading import GraphDataLoader
 
-from nclustenv.utils.helper import loader, parse_ds_settings, isListEmpty
+from nclustenv.utils.helper import loader, parse_ds_settings, isListEmpty, membership_from_clusters, real_to_ind, \
+    dense_to_dgl, dgl_to_dense, edge_stats, membership_from_graph, resolve_device
 from nclustenv.utils.states import State, OfflineState
-from nclustenv.utils.actions import Action
-from nclustenv.environments.classic_lr import BiclusterEnv, TriclusterEnv
+from nclustenv.utils.actions import Action, RangeAction
+from nclustenv.utils.metrics import match_score, batched_match_score
+from nclustenv.utils.bitset import PackedMembership, pack, unpack, popcount
+from nclustenv.utils.timing import PhaseTimer, NULL_TIMER
+from nclustenv.utils.sparsify import TopK, DropValues, Sample, cell_nodes, sparsify
+from nclustenv.environments.classic_lr import BiclusterEnv, TriclusterEnv, VecBiclusterEnv, VecTriclusterEnv, \
+    OfflineBiclusterEnv
 from nclustenv.utils.spaces import DGLHeteroGraphSpace
-from nclustenv.utils.datasets import SyntheticDataset
+from nclustenv.utils.datasets import SyntheticDataset, StreamingDataset
 from gym.spaces import Box
+from scipy.optimize import linear_sum_assignment
 
 from nclustenv.version import TESTING_CONFIGS, TESTING_CONFIGS_DATASETS
 
@@ -74,6 +87,274 @@ class ActionTest(TestCaseBase):
         self.assertEqual(Action(*scene).parameters, expected)
 
 
+class RangeActionTest(TestCaseBase):
+
+    def test_labels(self):
+
+        env = BiclusterEnv(action='RangeAction')
+
+        for _ in range(20):
+            scene = env.action_space.sample()
+            action = RangeAction(*scene)
+
+            self.assertEqual(len(action.parameters), RangeAction.nparams)
+            self.assertEqual(action.action, ['add_range', 'remove_range', 'merge', 'split'][scene[0]])
+
+    def test_ranges(self):
+
+        for packed in [False, True]:
+
+            env = BiclusterEnv(shape=[[100, 10], [100, 10]], n=1, seed=3, action='RangeAction', packed=packed)
+
+            # a 12x6 bicluster (rows 38 to 49, columns 2 to 7) in a single action, range ends in any order
+            env.step((0, [[0.0, 0.5, 0.38, 0.2, 0.8, 0.0, 0.0]] + [[0.0] * 7] * 3))
+
+            membership = env.state.membership
+            self.assertEqual(env.state.member_counts.tolist(), [[12], [6]])
+            self.assertEqual(membership[0][0].nonzero().flatten().tolist(), list(range(38, 50)))
+            self.assertEqual(membership[1][0].nonzero().flatten().tolist(), list(range(2, 8)))
+
+            self.assertAlmostEqual(env._last_distances[-1], env.volume_match)
+
+            # rows 44 to 99, no columns
+            env.step((1, [[0.0] * 7, [0.0, 0.44, 1.0, 0.0, 0.0, 0.0, 0.0]] + [[0.0] * 7] * 2))
+
+            self.assertEqual(env.state.member_counts.tolist(), [[6], [6]])
+            self.assertAlmostEqual(env._last_distances[-1], env.volume_match)
+
+            # masks and index arrays, with repetitions
+            mask = np.zeros(10, dtype=bool)
+            mask[[1, 3]] = True
+
+            env.state.set_nodes(True, 0, [[0, 0, 5], mask])
+            env.step_many([])
+
+            self.assertEqual(env.state.member_counts.tolist(), [[8], [7]])
+            self.assertAlmostEqual(env._last_distances[-1], env.volume_match)
+
+            graph = env.state.state['state']
+
+            for axis, mask in zip(env.state.membership, membership_from_graph(graph, env.state._ntypes)):
+                self.assertTrue(th.equal(axis, mask))
+
+
+class MetricsTest(TestCaseBase):
+
+    def setUp(self):
+
+        rng = np.random.RandomState(3)
+
+        self.sizes = [40, 12, 4]
+        self.scenarios = []
+
+        for _ in range(20):
+            fclusts, hclusts = [
+                [[sorted(rng.choice(size, rng.randint(1, size), replace=False).tolist()) for size in self.sizes]
+                 for _ in range(rng.randint(1, 5))]
+                for _ in range(2)
+            ]
+            self.scenarios.append((fclusts, hclusts))
+
+    def test_batched_match_score(self):
+
+        for fclusts, hclusts in self.scenarios:
+
+            expected = match_score(fclusts, hclusts)
+            res = batched_match_score(
+                membership_from_clusters(fclusts, self.sizes), membership_from_clusters(hclusts, self.sizes)
+            )
+
+            self.assertEqual(res.shape, expected.shape)
+            self.assertTrue(np.allclose(res, expected))
+
+    def test_empty_found_cluster(self):
+
+        fclusts = [[[] for _ in self.sizes]]
+        hclusts = self.scenarios[0][1]
+
+        res = batched_match_score(
+            membership_from_clusters(fclusts, self.sizes), membership_from_clusters(hclusts, self.sizes)
+        )
+
+        self.assertTrue((res == 1.0).all())
+
+
+class VolumeMatchTest(TestCaseBase):
+
+    def setUp(self):
+
+        self.envs = [
+            BiclusterEnv(shape=[[30, 10], [30, 10]], n=2, clusters=[3, 3], seed=3),
+            BiclusterEnv(shape=[[30, 10], [30, 10]], clusters=[1, 3], seed=5),
+            TriclusterEnv(shape=[[20, 8, 3], [20, 8, 3]], n=3, clusters=[2, 2], seed=7),
+        ]
+
+    def test_incremental(self):
+
+        for env in self.envs:
+
+            rng = np.random.RandomState(1)
+
+            for _ in range(100):
+
+                action = env.action_space.sample()
+                params = rng.uniform(size=3)
+
+                # mostly add nodes of hidden clusters, so that the distances change
+                if action[0] < 2 and rng.uniform() < 0.7:
+                    axis = real_to_ind(env.state._ntypes, params[0])
+                    nnodes = env.state.current.num_nodes(env.state._ntypes[axis])
+                    params[1] = rng.choice(env.state.hclusters[0][axis]) / (nnodes - 1)
+
+                action = (action[0], [params for _ in range(4)])
+                _, _, done, _ = env.step(action)
+
+                cost_matrix = env.cost_matrix
+                row_ind, col_ind = linear_sum_assignment(cost_matrix)
+
+                self.assertTrue(np.allclose(env._tracker.cost_matrix, cost_matrix))
+                self.assertAlmostEqual(
+                    cost_matrix[env._assignment].sum(), cost_matrix[row_ind, col_ind].sum()
+                )
+
+                if done:
+                    env.reset()
+
+
+class VecEnvTest(TestCaseBase):
+
+    def setUp(self):
+
+        self.envs = [
+            VecBiclusterEnv(num_envs=4, shape=[[20, 8], [30, 10]], n=2, clusters=[1, 3], seed=3),
+            VecBiclusterEnv(num_envs=3, shape=[[20, 8], [30, 10]], clusters=[1, 3], seed=5, max_steps=20),
+            VecTriclusterEnv(num_envs=3, shape=[[15, 6, 2], [20, 8, 3]], clusters=[2, 2], seed=7),
+        ]
+
+    def _episode_cost(self, env, i):
+
+        membership = [
+            m[:env._nclusters[i], env._offsets[a][i]:env._offsets[a][i + 1]] for a, m in enumerate(env.membership)
+        ]
+        cost_matrix = batched_match_score(membership, env.states[i].hmembership)
+        row_ind, col_ind = linear_sum_assignment(cost_matrix)
+
+        return (cost_matrix[row_ind, col_ind] * env.states[i].cluster_coverage[col_ind]).sum()
+
+    def test_reset(self):
+
+        for env in self.envs:
+
+            obs = env.reset()
+
+            self.assertEqual(obs['state'].batch_size, env.num_envs)
+            self.assertEqual(obs['action_mask'].shape, (env.num_envs, 4))
+            self.assertTrue((obs['action_mask'][:, 0] == 1).all())
+            self.assertTrue((obs['action_mask'][:, 1] == 0).all())
+
+            for i, state in enumerate(env.states):
+                for ntype in env._ntypes:
+                    self.assertEqual(int(obs['state'].batch_num_nodes(ntype)[i]), state.current.num_nodes(ntype))
+
+    def test_step(self):
+
+        for env in self.envs:
+
+            env.reset()
+
+            for _ in range(60):
+
+                obs, rewards, dones, infos = env.step(env.action_space.sample())
+
+                self.assertEqual(rewards.shape, (env.num_envs,))
+                self.assertEqual(dones.shape, (env.num_envs,))
+
+                for i in range(env.num_envs):
+
+                    # unused cluster slots stay empty
+                    for a, m in enumerate(env.membership):
+                        self.assertFalse(m[env._nclusters[i]:, env._offsets[a][i]:env._offsets[a][i + 1]].any())
+
+                    if dones[i]:
+                        self.assertEqual(env._current_step[i], 0)
+                    else:
+                        self.assertAlmostEqual(env._last_distances[i, -1], self._episode_cost(env, i))
+
+                for k in range(env._capacity):
+                    self.assertTrue(th.equal(obs['state'].nodes['row'].data[k], env.membership[0][k]))
+
+    def test_restructure(self):
+
+        env = self.envs[1]
+        env.reset()
+
+        index = np.full(env.num_envs, 3)
+        params = np.full((env.num_envs, 4, 3), 0.0, dtype=np.float32)
+
+        # split the only cluster of every episode
+        env.step((index, params))
+        self.assertTrue((env._nclusters == 2).all())
+
+        # merge them back
+        params[:, 2, 1] = 1.0
+        env.step((np.full(env.num_envs, 2), params))
+        self.assertTrue((env._nclusters == 1).all())
+
+
+class PrefetchTest(TestCaseBase):
+
+    def setUp(self):
+
+        config = dict(shape=[[20, 8], [30, 10]], clusters=[1, 3], seed=11)
+
+        self.env = BiclusterEnv(**config)
+        self.prefetch_env = BiclusterEnv(prefetch=2, **config)
+
+    def tearDown(self):
+        self.prefetch_env.close()
+
+    def test_reset(self):
+
+        for _ in range(3):
+
+            state = self.prefetch_env.state
+
+            self.assertTrue((state.as_dense == self.env.state.as_dense).all())
+            self.assertEqual(state.hclusters, self.env.state.hclusters)
+            self.assertTrue(isListEmpty(state.clusters))
+            self.assertTrue(th.equal(
+                state.current.edata['w'], self.env.state.current.edata['w']
+            ))
+            self.assertTrue(self.prefetch_env.observation_space.contains(state.state))
+
+            self.env.reset()
+            self.prefetch_env.reset()
+
+    def test_construction(self):
+
+        config = dict(shape=[[20, 8], [30, 10]], clusters=[1, 3], seed=11, construction='dense', device='cpu')
+
+        env = BiclusterEnv(**config)
+        prefetch_env = BiclusterEnv(prefetch=2, **config)
+
+        try:
+            for _ in range(3):
+
+                # pooled episodes are built as inline ones, with the weights a view of the array
+                state = prefetch_env.state
+
+                self.assertEqual(state.as_dense.dtype, np.float32)
+                self.assertTrue((state.as_dense == env.state.as_dense).all())
+                self.assertEqual(state.current.edata['w'].data_ptr(), state.as_dense.ctypes.data)
+                self.assertEqual(state.current.device, th.device('cpu'))
+
+                env.reset()
+                prefetch_env.reset()
+
+        finally:
+            prefetch_env.close()
+
+
 class SpaceTest(TestCaseBase):
     def setUp(self):
 
@@ -115,6 +396,55 @@ class SpaceTest(TestCaseBase):
         for _ in range(50):
             self.assertTrue(self.space.contains(self.state.reset(*self.space.sample())['state']))
 
+    def test_symbolic(self):
+
+        space = DGLHeteroGraphSpace(
+            shape=[[5, 5], [10, 10]],
+            n=1,
+            settings=parse_ds_settings({'dstype': {'value': 'Symbolic'}, 'nsymbols': {'value': 3}})
+        )
+
+        x = np.random.RandomState(0).randint(0, 3, size=(6, 8))
+
+        for valid in [True, False]:
+
+            if not valid:
+                x[0, 0] = 3
+
+            graph = dense_to_dgl(x)
+
+            for ntype in graph.ntypes:
+                graph.nodes[ntype].data[0] = th.zeros(graph.num_nodes(ntype), dtype=th.bool)
+
+            weights = graph.edata['w'].clone()
+
+            self.assertEqual(space.contains(graph), valid)
+            self.assertTrue(th.equal(graph.edata['w'], weights))
+
+        # structure validation skips edge weights
+        space.validation = 'structure'
+        self.assertTrue(space.contains(graph))
+
+    def test_edge_stats(self):
+
+        graph = self.state.current
+        weights = graph.edata['w']
+
+        # statistics are computed when the state is reset, and shared with the space
+        stats = self.state.edge_stats
+
+        self.assertIs(edge_stats(graph), stats)
+        self.assertEqual(stats['min'], weights.min().item())
+        self.assertEqual(stats['max'], weights.max().item())
+        self.assertTrue(stats['isreal'])
+
+        self.assertTrue(self.space.contains(graph))
+        stats['max'] = 100.0
+        self.assertFalse(self.space.contains(graph))
+
+        self.state.reset(shape=[150, 30], nclusters=3, settings={'seed': 5})
+        self.assertIsNot(self.state.edge_stats, stats)
+
 
 class StateTest(TestCaseBase):
 
@@ -211,11 +541,40 @@ class StateTest(TestCaseBase):
                     [[[] for _ in range(state._generator._n)] for _ in range(state.n)]
                 )
 
+    def test_membership(self):
+
+        for state in self.states:
+
+            state.add([0.1, 0.3, 0.1])
+            state.add([0.9, 0.6, 0.1])
+
+            expected = [[[i for i, val in enumerate(state.current.nodes[ntype].data[j]) if val]
+                         for ntype in state._ntypes]
+                        for j in state.current.nodes[state._ntypes[0]].data.keys()]
+
+            self.assertEqual(state.clusters, expected)
+            self.assertEqual(state.nclusters, len(expected))
+            self.assertEqual(
+                [[axis.tolist() for axis in cluster] for cluster in state.cluster_index],
+                expected
+            )
+
+            for i, ntype in enumerate(state._ntypes):
+                self.assertEqual(tuple(state.membership[i].shape), (len(expected), state.current.num_nodes(ntype)))
+
     def test_hclusters(self):
 
         for state in self.states:
             self.assertEqual(state.hclusters, state._generator.Y)
 
+    def test_hmembership(self):
+
+        for state in self.states:
+            self.assertEqual(
+                [[axis.nonzero().flatten().tolist() for axis in cluster] for cluster in zip(*state.hmembership)],
+                [[sorted(axis) for axis in cluster] for cluster in state.hclusters]
+            )
+
     def test_coverage(self):
 
         for state in self.states:
@@ -328,6 +687,625 @@ class StateTest(TestCaseBase):
                 self.assertEqual(len(state.clusters), original_len)
                 self.assertEqual(state.clusters[-1], original_cluster)
 
+    def test_member_counts(self):
+
+        np_random = np.random.RandomState(7)
+
+        for state in self.states:
+
+            actions = [state.add, state.remove]
+
+            if not state.defined:
+                actions += [state.merge, state.split]
+
+            for _ in range(60):
+                actions[np_random.randint(len(actions))](np_random.uniform(size=3).tolist())
+
+                expected = np.stack([mask.sum(1).numpy() for mask in state.membership])
+                self.assertTrue(np.array_equal(state.member_counts, expected))
+
+                add = any(not mask.all() for membership in state.membership for mask in membership)
+                remove = any(mask.any() for membership in state.membership for mask in membership)
+                self.assertEqual(state.state['action_mask'][:2].tolist(), [add, remove])
+
+
+class PackedStateTest(TestCaseBase):
+
+    def test_bitset(self):
+
+        np_random = np.random.RandomState(0)
+
+        for nbits in [1, 63, 64, 65, 130]:
+            mask = np_random.uniform(size=(3, nbits)) < 0.5
+            words = pack(mask)
+
+            self.assertEqual(words.shape, (3, (nbits + 63) // 64))
+            self.assertTrue(np.array_equal(unpack(words, nbits), mask))
+            self.assertTrue(np.array_equal(popcount(words), mask.sum(1)))
+
+            packed = PackedMembership([th.from_numpy(mask)])
+            index = np_random.randint(nbits)
+            packed.split(0, [index])
+
+            self.assertTrue(np.array_equal(packed.tensors()[0][-2].numpy(), mask[0] & (np.arange(nbits) < index)))
+            self.assertTrue(np.array_equal(packed.tensors()[0][-1].numpy(), mask[0] & (np.arange(nbits) >= index)))
+
+    def test_state(self):
+
+        for n in [None, 3]:
+
+            states = [State(n=n, np_random=np.random.RandomState(1), packed=packed) for packed in [False, True]]
+
+            for state in states:
+                state.reset(shape=[60, 20], nclusters=2, settings={'seed': 3, 'silence': True})
+
+            np_random = np.random.RandomState(2)
+            actions = ['add', 'remove'] if n else ['add', 'remove', 'merge', 'split']
+
+            for _ in range(80):
+                action = actions[np_random.randint(len(actions))]
+                params = np_random.uniform(size=3).tolist()
+
+                observations = []
+
+                for state in states:
+                    getattr(state, action)(params)
+                    observations.append(state.state)
+
+                self.assertEqual(states[0].clusters, states[1].clusters)
+                self.assertTrue(np.array_equal(states[0].member_counts, states[1].member_counts))
+                self.assertTrue((observations[0]['action_mask'] == observations[1]['action_mask']).all())
+
+                # node data is written when the observation is emitted
+                membership = membership_from_graph(states[1].current, states[1]._ntypes)
+
+                for expected, mask in zip(states[0].membership, membership):
+                    self.assertTrue(th.equal(expected, mask))
+
+    def test_env(self):
+
+        envs = [
+            BiclusterEnv(shape=[[50, 20], [60, 25]], clusters=[1, 3], seed=4, packed=packed) for packed in [False, True]
+        ]
+        np_random = np.random.RandomState(5)
+
+        for _ in range(50):
+            action = (np_random.randint(4), [np_random.uniform(size=3) for _ in range(4)])
+            results = [env.step(action)[1:3] for env in envs]
+
+            self.assertEqual(results[0], results[1])
+
+            if results[0][1]:
+                for env in envs:
+                    env.reset()
+
+
+class GraphViewTest(TestCaseBase):
+
+    def test_views(self):
+
+        env = BiclusterEnv(shape=[[50, 20], [60, 25]], clusters=[1, 3], seed=4, observation='view')
+        np_random = np.random.RandomState(6)
+
+        views = [env.reset()['state']]
+        expected = [[mask.clone() for mask in env.state.membership]]
+
+        for _ in range(20):
+            action = (np_random.randint(2), [np_random.uniform(size=3) for _ in range(4)])
+            obs, reward, done, info = env.step(action)
+
+            views.append(obs['state'])
+            expected.append([mask.clone() for mask in env.state.membership])
+
+            if done:
+                break
+
+        membership = [mask.clone() for mask in env.state.membership]
+
+        for view, masks in zip(views, expected):
+
+            self.assertTrue(env.observation_space['state'].contains(view))
+
+            # snapshots are not affected by later steps
+            for mask, axis in zip(masks, membership_from_graph(view.graph, env.state._ntypes)):
+                self.assertTrue(th.equal(mask, axis))
+
+            # structure and edge weights are shared with the episode
+            self.assertEqual(view.graph.edata['w'].data_ptr(), env.state.current.edata['w'].data_ptr())
+
+        # building views does not change the state
+        for mask, axis in zip(membership, env.state.membership):
+            self.assertTrue(th.equal(mask, axis))
+
+
+class DenseObservationTest(TestCaseBase):
+
+    def test_env(self):
+
+        for cls, shape, clusters in [
+            (BiclusterEnv, [[20, 10], [30, 15]], [1, 2]), (TriclusterEnv, [[10, 10, 3], [15, 15, 5]], [1, 2])
+        ]:
+
+            env = cls(shape=shape, clusters=clusters, seed=3, observation='dense')
+            np_random = np.random.RandomState(0)
+
+            obs = env.reset()
+            values = obs['state']['values']
+
+            self.assertEqual(values.shape, tuple(shape[1]))
+            self.assertTrue(env.observation_space.contains(obs))
+
+            # values are written with ntypes as axes
+            x = env.state.as_dense
+
+            if x.ndim == 3:
+                x = np.moveaxis(x, 0, -1)
+
+            self.assertTrue(np.array_equal(values[tuple(slice(0, size) for size in x.shape)], x.astype(np.float32)))
+            self.assertTrue(np.array_equal(obs['state']['shape'], x.shape))
+
+            for _ in range(50):
+                obs, reward, done, info = env.step(
+                    (np_random.randint(4), [np_random.uniform(size=3) for _ in range(4)])
+                )
+                state = obs['state']
+
+                # arrays are updated in place
+                self.assertIs(state['values'], values)
+                self.assertTrue(env.observation_space['state'].contains(state))
+
+                membership = env.state.membership
+
+                self.assertEqual(state['nclusters'], membership[0].shape[0])
+                self.assertLessEqual(state['nclusters'], 2 * clusters[1])
+
+                for mask, axis in zip(state['clusters'], membership):
+                    nclusters, nnodes = axis.shape
+
+                    self.assertTrue(np.array_equal(mask[:nclusters, :nnodes], axis.numpy()))
+                    self.assertFalse(mask[nclusters:].any() or mask[:, nnodes:].any())
+
+                if done:
+                    break
+
+
+class SnapshotTest(TestCaseBase):
+
+    def _rollout(self, env, actions):
+
+        rewards = []
+
+        for action in actions:
+            obs, reward, done, info = env.step(action)
+            rewards.append(reward)
+
+        return rewards, [mask.clone() for mask in env.state.membership], env.state.member_counts.copy()
+
+    def test_restore(self):
+
+        for packed in [False, True]:
+
+            env = BiclusterEnv(shape=[[50, 20], [60, 25]], clusters=[1, 3], seed=2, packed=packed)
+            np_random = np.random.RandomState(5)
+
+            actions = [(np_random.randint(4), [np_random.uniform(size=3) for _ in range(4)]) for _ in range(30)]
+
+            self._rollout(env, actions[:10])
+
+            token = env.snapshot()
+            membership = [mask.clone() for mask in env.state.membership]
+            step = env._current_step
+
+            # branches from the same snapshot are identical, including splits drawing from the random state
+            rewards, branch, counts = self._rollout(env, actions[10:])
+
+            for _ in range(2):
+                env.restore(token)
+
+                self.assertEqual(env._current_step, step)
+
+                for mask, axis in zip(membership, env.state.membership):
+                    self.assertTrue(th.equal(mask, axis))
+
+                self.assertEqual(self._rollout(env, actions[10:])[0], rewards)
+                self.assertTrue(np.array_equal(env.state.member_counts, counts))
+
+                for mask, axis in zip(branch, env.state.membership):
+                    self.assertTrue(th.equal(mask, axis))
+
+            env.reset()
+
+            with self.assertRaises(AttributeError):
+                env.restore(token)
+
+
+class CloneTest(TestCaseBase):
+
+    def test_clone(self):
+
+        for kwargs in [{}, {'packed': True}, {'observation': 'dense'}]:
+
+            env = BiclusterEnv(shape=[[50, 20], [60, 25]], clusters=[1, 3], seed=7, **kwargs)
+            np_random = np.random.RandomState(1)
+
+            actions = [(np_random.randint(4), [np_random.uniform(size=3) for _ in range(4)]) for _ in range(20)]
+
+            for action in actions[:5]:
+                env.step(action)
+
+            clones = [env.clone() for _ in range(2)]
+            membership = [mask.clone() for mask in env.state.membership]
+
+            # episode data is shared
+            for clone in clones:
+                self.assertIs(clone.state.hmembership, env.state.hmembership)
+                self.assertEqual(
+                    clone.state.current.edata['w'].data_ptr(), env.state.current.edata['w'].data_ptr()
+                )
+                self.assertTrue(clone.state.current.edata['w'].is_shared())
+
+            # clones step independently, and identically given the same actions
+            rewards = [[clone.step(action)[1] for action in actions[5:]] for clone in clones]
+
+            self.assertEqual(rewards[0], rewards[1])
+
+            for mask, axis in zip(membership, env.state.membership):
+                self.assertTrue(th.equal(mask, axis))
+
+            self.assertEqual([env.step(action)[1] for action in actions[5:]], rewards[0])
+
+            for mask, axis in zip(env.state.membership, clones[0].state.membership):
+                self.assertTrue(th.equal(mask, axis))
+
+    def test_dense_construction(self):
+
+        env = BiclusterEnv(shape=[[50, 20], [60, 25]], clusters=[1, 3], seed=7, construction='dense')
+
+        x = env.state.as_dense
+        clone = env.clone()
+
+        # the source state is untouched
+        self.assertIs(env.state.as_dense, x)
+
+        # the edge weights are still a view of the array, shared by the clone
+        for state in [env.state, clone.state]:
+            self.assertIs(state.as_dense, x)
+            self.assertEqual(state.current.edata['w'].data_ptr(), x.ctypes.data)
+
+    def test_offline(self):
+
+        os.makedirs('test_files', exist_ok=True)
+
+        dataset = self._build_dataset(
+            length=6, shape=[[20, 5], [30, 8]], clusters=[1, 3], seed=0, name='clone', save_dir='test_files'
+        )
+
+        envs = [OfflineBiclusterEnv(dataset, train_test_split=0.5, seed=1) for _ in range(2)]
+
+        # resetting a clone does not advance the episodes of its environment
+        clone = envs[0].clone()
+
+        for _ in range(4):
+            clone.reset()
+            clone.reset(train=False)
+
+        for train in [True, True, False, True, False, False]:
+            hclusters = []
+
+            for env in envs:
+                env.reset(train=train)
+                hclusters.append(str(env.state.hclusters))
+
+            self.assertEqual(hclusters[0], hclusters[1])
+
+        shutil.rmtree('test_files')
+
+
+class StepManyTest(TestCaseBase):
+
+    def test_step_many(self):
+
+        envs = [BiclusterEnv(shape=[[50, 20], [60, 25]], clusters=[1, 3], seed=8) for _ in range(2)]
+        np_random = np.random.RandomState(2)
+
+        for _ in range(3):
+
+            # e.g. add 40 rows to a cluster, then a few random actions
+            actions = [(0, [[0.0, i / 40, 0.0]] + [np_random.uniform(size=3) for _ in range(3)]) for i in range(40)]
+            actions += [(np_random.randint(4), [np_random.uniform(size=3) for _ in range(4)]) for _ in range(5)]
+
+            step = envs[0]._current_step
+
+            obs, reward, done, info = envs[0].step_many(actions)
+
+            for action in actions:
+                envs[1].step(action)
+
+            self.assertEqual(envs[0]._current_step, step + len(actions))
+            self.assertAlmostEqual(envs[0]._last_distances[-1], envs[0].volume_match)
+            self.assertAlmostEqual(envs[0]._last_distances[-1], envs[1]._last_distances[-1])
+
+            for mask, axis in zip(envs[0].state.membership, envs[1].state.membership):
+                self.assertTrue(th.equal(mask, axis))
+
+            if done:
+                break
+
+
+class TimingTest(TestCaseBase):
+
+    def test_timer(self):
+
+        timer = PhaseTimer()
+
+        for _ in range(3):
+            with timer.phase('metric'):
+                pass
+
+        self.assertEqual(timer.summary()['metric']['calls'], 3)
+        self.assertGreaterEqual(timer.summary()['metric']['time'], 0.0)
+
+        timer.reset()
+        self.assertEqual(timer.summary(), {})
+
+        with NULL_TIMER.phase('metric'):
+            pass
+
+        self.assertEqual(NULL_TIMER.summary(), {})
+
+    def test_env(self):
+
+        env = BiclusterEnv(shape=[[50, 20], [60, 25]], clusters=[1, 3], seed=2, timing=True)
+        obs, reward, done, info = env.step((3, [[0.5] * 3] * 4))
+
+        self.assertEqual(
+            set(info['timings']), {'action', 'metric', 'assignment', 'observation', 'generation', 'to_graph'}
+        )
+        self.assertEqual(info['timings']['action']['calls'], 1)
+        self.assertEqual(env.timings, info['timings'])
+
+        # disabled by default
+        env = BiclusterEnv(shape=[[50, 20], [60, 25]], clusters=[1, 3], seed=2)
+        obs, reward, done, info = env.step((3, [[0.5] * 3] * 4))
+
+        self.assertEqual(info, {})
+        self.assertEqual(env.timings, {})
+
+
+class ConstructionTest(TestCaseBase):
+
+    def test_dense(self):
+
+        for cls, shape, clusters in [
+            (BiclusterEnv, [[50, 20], [60, 25]], [1, 3]), (TriclusterEnv, [[10, 10, 3], [15, 15, 5]], [1, 2])
+        ]:
+
+            envs = [cls(shape=shape, clusters=clusters, seed=5, construction=mode) for mode in ['nclustgen', 'dense']]
+            graph, expected = envs[1].state.current, envs[0].state.current
+
+            # same graph as nclustgen's
+            self.assertEqual(graph.canonical_etypes, expected.canonical_etypes)
+
+            for etype in expected.canonical_etypes:
+                for ids, expected_ids in zip(graph.edges(etype=etype), expected.edges(etype=etype)):
+                    self.assertTrue(th.equal(ids.long(), expected_ids.long()))
+
+                self.assertTrue(th.equal(graph.edges[etype].data['w'], expected.edges[etype].data['w']))
+
+                # weights are a view of the array
+                self.assertEqual(graph.edges[etype].data['w'].data_ptr(), envs[1].state.as_dense.ctypes.data)
+
+            # same episode
+            np_random = np.random.RandomState(0)
+
+            for _ in range(30):
+                action = (np_random.randint(4), [np_random.uniform(size=3) for _ in range(4)])
+                self.assertEqual(envs[0].step(action)[1], envs[1].step(action)[1])
+
+
+class SparsifyTest(TestCaseBase):
+
+    def test_policies(self):
+
+        for cls, shape, clusters in [
+            (BiclusterEnv, [[50, 20], [60, 25]], [1, 3]), (TriclusterEnv, [[10, 10, 3], [15, 15, 5]], [1, 2])
+        ]:
+
+            full = cls(shape=shape, clusters=clusters, seed=5)
+            nedges = full.state.current.num_edges(('row', 'elem', 'col'))
+
+            for policy in [TopK(2), DropValues([full.state.as_dense.flat[0]]), Sample(40)]:
+
+                env = cls(shape=shape, clusters=clusters, seed=5, sparsify=policy)
+                graph = env.state.current
+
+                # every node is kept, with fewer edges
+                self.assertEqual(graph.ntypes, full.state.current.ntypes)
+                self.assertEqual(env.state.shape, full.state.shape)
+                self.assertLess(graph.num_edges(('row', 'elem', 'col')), nedges)
+                self.assertTrue(env.observation_space.contains(env.state.state))
+
+                # kept elements have their weights in every etype
+                x = env.state.as_dense
+                x = np.moveaxis(x, 0, -1) if len(shape[0]) == 3 else x
+
+                weights = graph.edges[graph.canonical_etypes[0]].data['w']
+
+                for etype in graph.canonical_etypes:
+                    self.assertTrue(th.equal(graph.edges[etype].data['w'], weights))
+
+                weights = weights.numpy()
+                self.assertTrue(np.allclose(weights, x[tuple(nodes.numpy() for nodes in cell_nodes(graph))]))
+
+                if isinstance(policy, TopK):
+                    for nodes in cell_nodes(graph):
+                        self.assertGreaterEqual(th.bincount(nodes).min().item(), 2)
+
+                elif isinstance(policy, DropValues):
+                    self.assertFalse(np.isin(weights, np.float32(policy.values)).any())
+
+                else:
+                    self.assertEqual(len(weights), 40)
+
+    def test_reward(self):
+
+        # the reward is computed on the full data
+        envs = [BiclusterEnv(shape=[[50, 20], [60, 25]], clusters=[1, 3], seed=5, sparsify=policy)
+                for policy in [None, TopK(2)]]
+
+        np_random = np.random.RandomState(0)
+
+        for _ in range(30):
+            action = (np_random.randint(4), [np_random.uniform(size=3) for _ in range(4)])
+            self.assertEqual(envs[0].step(action)[1], envs[1].step(action)[1])
+
+    def test_invalid(self):
+
+        self.assertRaises(AttributeError, TopK, 0)
+        self.assertRaises(AttributeError, Sample, 0)
+
+        # a policy keeping no edges, e.g. dropping every value of the episode, leaves the graph unchanged
+        graph = BiclusterEnv(shape=[[50, 20], [60, 25]], clusters=[1, 3], seed=5).state.current
+
+        with self.assertWarns(RuntimeWarning):
+            self.assertIs(sparsify(graph, DropValues(th.unique(graph.edata['w']).tolist())), graph)
+
+
+class DeviceTest(TestCaseBase):
+
+    def test_resolve(self):
+
+        self.assertIsNone(resolve_device(None))
+        self.assertEqual(resolve_device('cpu'), th.device('cpu'))
+
+        if th.cuda.is_available():
+            self.assertEqual(resolve_device('cuda'), th.device('cuda', th.cuda.current_device()))
+
+    def test_cpu(self):
+
+        cpu = th.device('cpu')
+
+        for cls, shape, clusters in [
+            (BiclusterEnv, [[50, 20], [60, 25]], [1, 3]), (TriclusterEnv, [[10, 10, 3], [15, 15, 5]], [1, 2])
+        ]:
+
+            for construction in ['nclustgen', 'dense']:
+
+                # nclustgen warns when it probes for a gpu and falls back to the cpu
+                with warnings.catch_warnings(record=True) as caught:
+                    warnings.simplefilter('always')
+                    env = cls(shape=shape, clusters=clusters, seed=5, construction=construction, device='cpu')
+
+                self.assertFalse([warning for warning in caught if 'CUDA' in str(warning.message)])
+
+                graph = env.state.current
+                self.assertEqual(graph.device, cpu)
+                self.assertTrue(all(mask.device == cpu for mask in env.state.hmembership))
+                self.assertTrue(all(mask.device == cpu for mask in env.state.membership))
+
+                # same episode as without device placement
+                legacy = cls(shape=shape, clusters=clusters, seed=5, construction=construction)
+                np_random = np.random.RandomState(0)
+
+                for _ in range(20):
+                    action = (np_random.randint(4), [np_random.uniform(size=3) for _ in range(4)])
+                    self.assertEqual(env.step(action)[1], legacy.step(action)[1])
+
+
+class BenchTest(TestCaseBase):
+
+    def test_run(self):
+
+        from nclustenv import bench
+
+        os.makedirs('test_files', exist_ok=True)
+        path = os.path.join('test_files', 'bench.json')
+
+        bench.main(['--scenarios', 'bic-binary-basic_v2', '--episodes', '2', '--max-steps', '5', '--output', path])
+
+        with open(path) as f:
+            results = json.load(f)
+
+        scenario = results['scenarios']['bic-binary-basic_v2']
+
+        self.assertEqual(scenario['env'], 'BiclusterEnv-v0')
+        self.assertEqual(scenario['resets'], 2)
+        self.assertLessEqual(scenario['steps'], 10)
+        self.assertLessEqual(scenario['step_ms']['p50'], scenario['step_ms']['p99'])
+        self.assertGreater(scenario['peak_rss_mb'], 0)
+        self.assertTrue({'action', 'metric', 'observation', 'generation', 'to_graph'} <= set(scenario['phases']))
+        self.assertEqual(scenario['phases']['generation']['calls'], 2)
+
+        shutil.rmtree('test_files')
+
+
+class RegistryTest(TestCaseBase):
+
+    def setUp(self):
+
+        from nclustenv.datasets import registry
+
+        self.registry = registry
+        self.loaded = dict(registry._datasets)
+
+    def tearDown(self):
+
+        # forget the datasets loaded by the tests
+        self.registry._datasets.clear()
+        self.registry._datasets.update(self.loaded)
+
+        if os.path.exists('test_files'):
+            shutil.rmtree('test_files')
+
+    def test_import(self):
+
+        # importing the datasets registers them, without building or loading any, in a fresh interpreter
+        code = '; '.join([
+            'import sys, json',
+            'import nclustenv.datasets',
+            'from nclustenv.datasets import registry',
+            "print(json.dumps([registry._datasets == {}, len(registry.names()), 'jpype' in sys.modules]))",
+        ])
+
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+        empty, registered, jvm = json.loads(output.strip().splitlines()[-1])
+
+        self.assertTrue(empty)
+        self.assertGreater(registered, 0)
+        self.assertFalse(jvm)
+
+    def test_load(self):
+
+        self.registry.register(
+            'registry_test', length=2, shape=[[20, 5], [30, 8]], clusters=[1, 2], seed=0, save_dir='test_files',
+            generator='BiclusterGenerator'
+        )
+
+        self.assertNotIn('registry_test', self.registry._datasets)
+        self.assertFalse(os.path.exists(os.path.join('test_files', 'registry_test')))
+
+        # built on first access, and cached
+        ds = self.registry.load('registry_test')
+
+        self.assertIsInstance(ds, SyntheticDataset)
+        self.assertEqual(len(ds), 2)
+        self.assertEqual(os.path.normpath(ds.save_path), os.path.join('test_files', 'registry_test'))
+        self.assertIs(self.registry.load('registry_test'), ds)
+
+        self.assertRaises(KeyError, self.registry.load, 'unregistered')
+
+    def test_module_attribute(self):
+
+        from nclustenv.datasets.biclustering import binary
+
+        self.registry._datasets.pop('bic_binary_base', None)
+
+        ds = binary.base
+
+        self.assertIs(self.registry._datasets['bic_binary_base'], ds)
+        self.assertIs(binary.base, ds)
+        self.assertIs(self.registry.load('bic_binary_base'), ds)
+
 
 class SyntheticDatasetTest(TestCaseBase):
 
@@ -363,7 +1341,7 @@ class SyntheticDatasetTest(TestCaseBase):
                         self.assertEqual(ds.settings, parse_ds_settings(config['dataset_settings']))
 
                     # Check save
-                    self.assertIsFile(os.path.join(ds.save_path, ds.name + '_dgl_graph.bin'))
+                    self.assertIsFile(os.path.join(ds.save_path, ds.name + '_weights.npy'))
                     self.assertIsFile(os.path.join(ds.save_path, ds.name + '_info.pkl'))
 
                 except Exception as e:
@@ -392,6 +1370,254 @@ class SyntheticDatasetTest(TestCaseBase):
                     self.assertEqual(ds.settings, parse_ds_settings(config['dataset_settings']))
 
 
+class ShardedDatasetTest(TestCaseBase):
+
+    def setUp(self) -> None:
+
+        self.config = {
+            'length': 6,
+            'shape': [[20, 5], [30, 8]],
+            'clusters': [1, 3],
+            'seed': 4,
+            'save_dir': 'test_files'
+        }
+        self.datasets = []
+
+    def tearDown(self) -> None:
+
+        while any(self.datasets):
+            ds = self.datasets.pop()
+
+            if os.path.exists(ds.save_path):
+                shutil.rmtree(ds.save_path)
+
+    def test_workers(self):
+
+        for workers in [1, 3, 4]:
+            self.datasets.append(self._build_dataset(name='sharded{}'.format(workers), workers=workers, **self.config))
+
+        serial = self.datasets[0]
+
+        for ds in self.datasets[1:]:
+
+            self.assertEqual(len(ds), len(serial))
+            self.assertEqual(ds.labels, serial.labels)
+
+            for graph, expected in zip(ds.graphs, serial.graphs):
+                self.assertEqual(graph.num_nodes('row'), expected.num_nodes('row'))
+                self.assertTrue(th.equal(graph.edata['w'], expected.edata['w']))
+
+
+class ColumnarDatasetTest(TestCaseBase):
+
+    def setUp(self) -> None:
+
+        self.configs = [
+            {'shape': [[20, 5], [30, 8]], 'clusters': [1, 3], 'generator': 'BiclusterGenerator'},
+            {'shape': [[10, 10, 3], [15, 15, 5]], 'clusters': [1, 2], 'generator': 'TriclusterGenerator'},
+        ]
+        self.datasets = []
+
+    def tearDown(self) -> None:
+
+        while any(self.datasets):
+            ds = self.datasets.pop()
+
+            if os.path.exists(ds.save_path):
+                shutil.rmtree(ds.save_path)
+
+    def assertGraphEqual(self, graph, expected):
+
+        self.assertEqual(graph.canonical_etypes, expected.canonical_etypes)
+
+        for ntype in expected.ntypes:
+            self.assertEqual(graph.num_nodes(ntype), expected.num_nodes(ntype))
+
+        for etype in expected.canonical_etypes:
+            for ids, expected_ids in zip(graph.edges(etype=etype), expected.edges(etype=etype)):
+                self.assertTrue(th.equal(ids.long(), expected_ids.long()))
+
+            self.assertTrue(th.equal(graph.edges[etype].data['w'], expected.edges[etype].data['w'].float()))
+
+    def test_load(self):
+
+        for i, config in enumerate(self.configs):
+
+            ds = self._build_dataset(length=4, seed=i, name='columnar', save_dir='test_files', **config)
+            self.datasets.append(ds)
+
+            loaded = self._build_dataset(name='columnar', save_dir='test_files')
+
+            self.assertIsNone(loaded.graphs)
+            self.assertEqual(len(loaded), len(ds))
+
+            for j in range(len(ds)):
+                graph, label = loaded[j]
+
+                self.assertEqual(label, ds.labels[j])
+                self.assertGraphEqual(graph, ds.graphs[j])
+
+            # memory maps are reopened when the dataset is sent to other processes
+            graph, label = pickle.loads(pickle.dumps(loaded))[-1]
+
+            self.assertEqual(label, ds.labels[-1])
+            self.assertGraphEqual(graph, ds.graphs[-1])
+
+            shutil.rmtree(ds.save_path)
+
+    def test_dense(self):
+
+        for config in self.configs:
+
+            generator = loader(config['generator'], nclustgen)(silence=True, seed=3)
+            generator.generate(*config['shape'][1], nclusters=1)
+            generator.to_graph(framework='dgl', device='cpu', nclusters=0)
+
+            self.assertGraphEqual(dense_to_dgl(generator.X), generator.graph)
+            self.assertTrue(np.array_equal(dgl_to_dense(generator.graph), generator.X.astype(np.float32)))
+
+
+class StreamingDatasetTest(TestCaseBase):
+
+    def setUp(self) -> None:
+
+        self.root = os.path.join('test_files', 'stream')
+        self.shards = [
+            self._build_dataset(
+                length=4, shape=[[20, 5], [30, 8]], clusters=[1, 3], seed=i, name='shard{}'.format(i),
+                save_dir=self.root
+            ) for i in range(3)
+        ]
+
+    def tearDown(self) -> None:
+
+        if os.path.exists(self.root):
+            shutil.rmtree(self.root)
+
+    @staticmethod
+    def _key(example):
+        graph, label = example
+        return str(label), graph.edata['w'].sum().item()
+
+    def test_stream(self):
+
+        expected = sorted(self._key(shard[i]) for shard in self.shards for i in range(len(shard)))
+
+        ds = StreamingDataset(self.root, buffer_size=5, seed=0)
+
+        self.assertEqual(len(ds), len(expected))
+        self.assertEqual(ds.shape, [[20, 5], [30, 8]])
+
+        # every epoch is a permutation of the whole corpus
+        for _ in range(2):
+            self.assertEqual(sorted(self._key(example) for example in ds), expected)
+
+    def test_workers(self):
+
+        # shards of different lengths, streamed by persistent workers
+        root = os.path.join('test_files', 'stream_workers')
+        shards = [
+            self._build_dataset(
+                length=length, shape=[[20, 5], [30, 8]], clusters=[1, 3], seed=10 + i, name='shard{}'.format(i),
+                save_dir=root
+            ) for i, length in enumerate([2, 9, 3, 7])
+        ]
+
+        def key(graph):
+            return graph.num_nodes('row'), graph.num_nodes('col'), graph.edata['w'].sum().item()
+
+        expected = sorted(key(shard[i][0]) for shard in shards for i in range(len(shard)))
+
+        loader = GraphDataLoader(
+            StreamingDataset(root, buffer_size=3, seed=0), batch_size=1, num_workers=2, persistent_workers=True,
+            multiprocessing_context='spawn'
+        )
+
+        # every epoch yields every example exactly once
+        for _ in range(4):
+            self.assertEqual(sorted(key(graph) for graph, _ in loader), expected)
+
+        del loader
+        shutil.rmtree(root)
+
+    def test_split(self):
+
+        train, test = StreamingDataset(self.root, seed=0).split(2 / 3)
+
+        self.assertEqual(len(train.shards), 2)
+        self.assertEqual(len(test.shards), 1)
+        self.assertFalse(set(train.shards) & set(test.shards))
+
+        self.assertEqual(len(train), 8)
+        self.assertEqual(len(test), 4)
+
+        # every stream gets at least one shard
+        for train_test_split, expected in [(0.1, 1), (0.99, 2)]:
+            train, test = StreamingDataset(self.root, seed=0).split(train_test_split)
+            self.assertEqual((len(train.shards), len(test.shards)), (expected, 3 - expected))
+
+        # a single shard cannot be split
+        single = StreamingDataset(StreamingDataset(self.root).shards[:1])
+        self.assertRaises(ValueError, single.split, 0.8)
+
+    def test_env(self):
+
+        env = OfflineBiclusterEnv(StreamingDataset(self.root, buffer_size=3, seed=0), train_test_split=2 / 3, seed=1)
+
+        for _ in range(10):
+            state = env.reset()
+            self.assertTrue(env.state.current.num_nodes('row') >= 20)
+
+            state, reward, done, info = env.step(env.action_space.sample())
+
+        _, done = env.state.reset(train=False)
+        self.assertFalse(done)
+
+
+class OfflineIteratorTest(TestCaseBase):
+
+    def setUp(self) -> None:
+
+        self.ds = self._build_dataset(
+            length=10, shape=[[20, 5], [30, 8]], clusters=[1, 3], seed=5, name='iterator', save_dir='test_files'
+        )
+
+    def tearDown(self) -> None:
+
+        if os.path.exists(self.ds.save_path):
+            shutil.rmtree(self.ds.save_path)
+
+    def _key(self, state):
+        return str([[[int(i) for i in axis] for axis in cluster] for cluster in state.label]), \
+            state.current.edata['w'].sum().item()
+
+    def test_epochs(self):
+
+        expected = [(str(label), graph.edata['w'].sum().item()) for graph, label in (self.ds[i] for i in range(10))]
+
+        for prefetch in [0, 2]:
+
+            state = OfflineState(self.ds, train_test_split=0.6, np_random=np.random.RandomState(0), prefetch=prefetch)
+
+            # every epoch is a permutation of the train split
+            for _ in range(2):
+                keys = []
+
+                for _ in range(6):
+                    state.reset()
+                    keys.append(self._key(state))
+
+                self.assertEqual(sorted(keys), sorted(expected[:6]))
+
+            # the test split is swept in order, and done flags its last example
+            for _ in range(2):
+                for i in range(4):
+                    _, done = state.reset(train=False)
+
+                    self.assertEqual(self._key(state), expected[6 + i])
+                    self.assertEqual(done, i == 3)
+
+
 class OfflineStateTest(TestCaseBase):
 
     def setUp(self) -> None: